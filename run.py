@@ -1,4 +1,6 @@
 from system import app
+from system.registry import models, WEB_MODELS
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    models.warm_up(WEB_MODELS)
+    app.run(debug=True)
@@ -0,0 +1,86 @@
+"""
+Throughput against latency of batched SSD inference on CPU.
+
+    python -m scripts.bench_batching --sessions 16 --fps 5 --batch 1 2 4 8 16 --wait 0 10 20 50
+
+Simulates --sessions students each sending --fps frames per second (taken
+from --video when given, random frames otherwise) and, for every
+combination of max batch size and max wait (ms), reports the frames/sec
+served and the per-frame latency from arrival to detections.
+"""
+import argparse, itertools, queue, threading, time
+import cv2
+import numpy as np
+from system.inference import MicroBatcher
+from system.registry import models
+
+
+def load_frames(path, count=64):
+    if not path:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(count)]
+    video = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ok, frame = video.read()
+        if not ok:
+            break
+        frames.append(frame)
+    return frames
+
+
+def run(frames, sessions, fps, max_batch, max_wait, duration):
+    inbox = queue.Queue()
+    stop = threading.Event()
+
+    def produce():
+        interval = 1.0 / (sessions * fps)
+        start = time.perf_counter()
+        for n in itertools.count():
+            if stop.is_set():
+                return
+            inbox.put((frames[n % len(frames)], time.perf_counter()))
+            time.sleep(max(0, start + (n + 1) * interval - time.perf_counter()))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    detector = models.ssd_batch
+    batcher = MicroBatcher(max_batch, max_wait)
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        batch = batcher.collect(inbox.get)
+        start = time.perf_counter()
+        detector.detect([frame for frame, _ in batch])
+        done = time.perf_counter()
+        batcher.stats.record([done - arrived for _, arrived in batch], done - start)
+    stop.set()
+    producer.join()
+    summary = batcher.stats.summary()
+    summary['backlog'] = inbox.qsize()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--video')
+    parser.add_argument('--sessions', type=int, default=16)
+    parser.add_argument('--fps', type=float, default=5)
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--wait', type=float, nargs='+', default=[0, 10, 20, 50], help='milliseconds')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--threads', type=int, help='cv2.setNumThreads, 1 to measure per core')
+    args = parser.parse_args()
+
+    if args.threads:
+        cv2.setNumThreads(args.threads)
+    frames = load_frames(args.video)
+    models.warm_up(['ssd_batch'])
+    print(f'{"batch":>5} {"wait ms":>7} {"fps":>7} {"infer fps":>9} {"mean batch":>10} {"p50 ms":>8} {"p99 ms":>8} {"backlog":>7}')
+    for max_batch, wait in itertools.product(args.batch, args.wait):
+        s = run(frames, args.sessions, args.fps, max_batch, wait / 1000, args.duration)
+        print(f'{max_batch:>5} {wait:>7g} {s["fps"]:>7.1f} {s["inference_fps"]:>9.1f} {s["mean_batch"]:>10.2f} '
+              f'{s["latency_p50_ms"]:>8.1f} {s["latency_p99_ms"]:>8.1f} {s["backlog"]:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Accuracy and CPU cost of the object detectors in DETECTORS.
+
+    python -m scripts.bench_detectors CLIPS --detectors ssd ssd-onnx ssd-int8 --threads 1 2 4
+
+CLIPS is a directory of video clips with a labels.csv of clip,frame,labels
+rows: the file name of a clip, a 0-based frame number and the
+';'-separated class names (as in coco.names) visible in that frame, empty
+for none. Only labelled frames are scored. For each detector and thread
+count, reports per watched class the frame-level recall and precision at
+--threshold, and the frames/sec of single-frame inference and per thread.
+"""
+import argparse, csv, os, time
+from collections import defaultdict
+import cv2
+from system import app
+from system.inference import build_detector
+from system.registry import models
+
+
+def load_clips(root):
+    labels = defaultdict(dict)
+    with open(os.path.join(root, 'labels.csv'), newline='') as f:
+        for row in csv.DictReader(f):
+            names = {name.strip().lower() for name in row['labels'].split(';') if name.strip()}
+            labels[row['clip']][int(row['frame'])] = names
+    frames = []
+    for clip, wanted in sorted(labels.items()):
+        video = cv2.VideoCapture(os.path.join(root, clip))
+        last = max(wanted)
+        for idx in range(last + 1):
+            ok, frame = video.read()
+            if not ok:
+                break
+            if idx in wanted:
+                frames.append((frame, wanted[idx]))
+        video.release()
+    return frames
+
+
+def evaluate(detector, frames, watched, threshold):
+    class_names = [name.lower() for name in models.class_names]
+    counts = {name: {'tp': 0, 'fp': 0, 'fn': 0} for name in watched}
+    detector.detect([frames[0][0]], threshold)
+    start = time.perf_counter()
+    for frame, truth in frames:
+        (classIds, confs, bbox), = detector.detect([frame], threshold)
+        found = {class_names[idx - 1] for idx in classIds.reshape(-1) if 0 < idx <= len(class_names)}
+        for name in watched:
+            if name in found and name in truth:
+                counts[name]['tp'] += 1
+            elif name in found:
+                counts[name]['fp'] += 1
+            elif name in truth:
+                counts[name]['fn'] += 1
+    elapsed = time.perf_counter() - start
+    return counts, len(frames) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('clips')
+    parser.add_argument('--detectors', nargs='+', default=sorted(app.config['DETECTORS']))
+    parser.add_argument('--threads', type=int, nargs='+', default=[1])
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--watch', nargs='+', default=['cell phone', 'laptop', 'book'])
+    args = parser.parse_args()
+
+    frames = load_clips(args.clips)
+    if not frames:
+        parser.error(f'no labelled frames found in {args.clips}')
+    watched = [name.lower() for name in args.watch]
+    print(f'{len(frames)} labelled frames')
+    print(f'{"detector":>10} {"threads":>7} {"fps":>7} {"fps/core":>8} ' +
+          ' '.join(f'{name[:12] + " R/P":>16}' for name in watched))
+    for name in args.detectors:
+        for threads in args.threads:
+            spec = dict(app.config['DETECTORS'][name], threads=threads)
+            try:
+                detector = build_detector(models.base, spec)
+            except Exception as e:
+                print(f'{name:>10} {threads:>7} could not load: {e}')
+                continue
+            counts, fps = evaluate(detector, frames, watched, args.threshold)
+            scores = []
+            for c in (counts[w] for w in watched):
+                recall = c['tp'] / (c['tp'] + c['fn']) if c['tp'] + c['fn'] else float('nan')
+                precision = c['tp'] / (c['tp'] + c['fp']) if c['tp'] + c['fp'] else float('nan')
+                scores.append(f'{recall:>7.2f}/{precision:<8.2f}')
+            print(f'{name:>10} {threads:>7} {fps:>7.1f} {fps / threads:>8.1f} ' + ' '.join(f'{s:>16}' for s in scores))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Capture loop frame rate during a burst of violations, saving evidence
+synchronously (cv2.imwrite to PNG, as the loop used to) and through the
+background EvidenceWriter.
+
+    python -m scripts.bench_evidence --frames 300 --burst 100 --every 1
+
+Each frame gets a fixed amount of stand-in analysis work. In the burst
+window every --every-th frame is a violation whose frame is saved.
+Reports frames/sec outside and inside the burst and the frames the
+writer dropped.
+"""
+import argparse, os, tempfile, time
+import cv2
+import numpy as np
+from system.evidence import EvidenceWriter
+
+
+def analyse(frame):
+    # stand-in for the per-frame analysis cost
+    cv2.GaussianBlur(frame, (15, 15), 0)
+
+
+def run(frames, burst, every, save):
+    calm, busy = [], []
+    for n, frame in enumerate(frames):
+        start = time.perf_counter()
+        analyse(frame)
+        in_burst = burst[0] <= n < burst[1]
+        if in_burst and n % every == 0:
+            save(n, frame)
+        (busy if in_burst else calm).append(time.perf_counter() - start)
+    return len(calm) / sum(calm), len(busy) / sum(busy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--burst', type=int, default=100, help='number of frames in the burst')
+    parser.add_argument('--every', type=int, default=1)
+    parser.add_argument('--codec', choices=['jpg', 'webp'], default='jpg')
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--max-width', type=int, default=640)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, (args.height, args.width, 3), dtype=np.uint8) for _ in range(8)]
+    frames = [frames[n % len(frames)] for n in range(args.frames)]
+    start = (args.frames - args.burst) // 2
+    burst = (start, start + args.burst)
+
+    with tempfile.TemporaryDirectory() as root:
+        def imwrite(n, frame):
+            cv2.imwrite(os.path.join(root, f'{n}.png'), frame)
+
+        writer = EvidenceWriter(root, args.codec, args.quality, args.max_width, max_pending=32)
+
+        def submit(n, frame):
+            writer.submit(f'async/{n}', frame)
+
+        print(f'{"":>12} {"calm fps":>9} {"burst fps":>9} {"dropped":>8}')
+        calm, busy = run(frames, burst, args.every, imwrite)
+        print(f'{"imwrite png":>12} {calm:>9.1f} {busy:>9.1f} {0:>8}')
+        calm, busy = run(frames, burst, args.every, submit)
+        writer._queue.join()
+        print(f'{"writer " + args.codec:>12} {calm:>9.1f} {busy:>9.1f} {writer.dropped:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Eye region extraction before and after the ROI-first rewrite of
+gaze_tracking.Eye.
+
+    python -m scripts.bench_eye --frames 2000 --width 640 --height 480
+
+Times the isolation of both eyes plus the blinking ratios per frame and
+measures the peak bytes allocated within a frame (tracemalloc sees numpy
+and OpenCV output arrays). The "before" column runs a copy of the previous
+implementation, which masked a full-frame array per eye.
+"""
+import argparse, math, time, tracemalloc
+from collections import namedtuple
+import cv2
+import numpy as np
+from system.gaze_tracking.eye import Eye, EyeBuffers, landmarks_to_array
+
+
+Point = namedtuple('Point', 'x y')
+
+
+class FakeLandmarks(object):
+    """Stands in for dlib.full_object_detection"""
+
+    def __init__(self, points):
+        self._points = [Point(int(x), int(y)) for x, y in points]
+
+    def part(self, idx):
+        return self._points[idx]
+
+    def parts(self):
+        return self._points
+
+
+def synthetic_landmarks(width, height):
+    points = np.zeros((68, 2), np.int32)
+    cx, cy, r = width // 2, height // 2, min(width, height) // 4
+    for first, offset in ((36, -r // 2), (42, r // 2)):
+        x, y = cx + offset, cy - r // 4
+        points[first:first + 6] = [(x - 18, y), (x - 7, y - 6), (x + 7, y - 6),
+                                   (x + 18, y), (x + 7, y + 6), (x - 7, y + 6)]
+    return FakeLandmarks(points)
+
+
+def legacy_isolate(frame, landmarks, points):
+    region = np.array([(landmarks.part(point).x, landmarks.part(point).y) for point in points])
+    region = region.astype(np.int32)
+    height, width = frame.shape[:2]
+    black_frame = np.zeros((height, width), np.uint8)
+    mask = np.full((height, width), 255, np.uint8)
+    cv2.fillPoly(mask, [region], (0, 0, 0))
+    eye = cv2.bitwise_not(black_frame, frame.copy(), mask=mask)
+    margin = 5
+    min_x = np.min(region[:, 0]) - margin
+    max_x = np.max(region[:, 0]) + margin
+    min_y = np.min(region[:, 1]) - margin
+    max_y = np.max(region[:, 1]) + margin
+    return eye[min_y:max_y, min_x:max_x]
+
+
+def legacy_blinking_ratio(landmarks, points):
+    def middle(p1, p2):
+        return (int((p1.x + p2.x) / 2), int((p1.y + p2.y) / 2))
+    left = (landmarks.part(points[0]).x, landmarks.part(points[0]).y)
+    right = (landmarks.part(points[3]).x, landmarks.part(points[3]).y)
+    top = middle(landmarks.part(points[1]), landmarks.part(points[2]))
+    bottom = middle(landmarks.part(points[5]), landmarks.part(points[4]))
+    eye_width = math.hypot((left[0] - right[0]), (left[1] - right[1]))
+    eye_height = math.hypot((top[0] - bottom[0]), (top[1] - bottom[1]))
+    return eye_width / eye_height
+
+
+def before(frame, landmarks, state):
+    frames = []
+    for points in (Eye.LEFT_EYE_POINTS, Eye.RIGHT_EYE_POINTS):
+        legacy_blinking_ratio(landmarks, points)
+        frames.append(legacy_isolate(frame, landmarks, points))
+    return frames
+
+
+def after(frame, landmarks, state):
+    array = landmarks_to_array(landmarks)
+    frames = []
+    for side, points in enumerate((Eye.LEFT_EYE_POINTS, Eye.RIGHT_EYE_POINTS)):
+        eye = Eye.__new__(Eye)
+        region = array[points]
+        eye._blinking_ratio(region)
+        eye._isolate(frame, region, side, state)
+        frames.append(eye.frame)
+    return frames
+
+
+def measure(fn, frame, landmarks, count):
+    state = EyeBuffers()
+    fn(frame, landmarks, state)
+    start = time.perf_counter()
+    for _ in range(count):
+        fn(frame, landmarks, state)
+    elapsed = time.perf_counter() - start
+
+    # peak of live allocations within a frame, averaged over a sample
+    tracemalloc.start()
+    sample = min(count, 200)
+    peaks = 0
+    for _ in range(sample):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn(frame, landmarks, state)
+        peaks += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return elapsed / count * 1e6, peaks // sample
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=2000)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (args.height, args.width), dtype=np.uint8)
+    landmarks = synthetic_landmarks(args.width, args.height)
+
+    old, new = before(frame, landmarks, None), after(frame, landmarks, EyeBuffers())
+    assert all(np.array_equal(a, b) for a, b in zip(old, new)), 'eye frames differ'
+
+    print(f'{"":>8} {"us/frame":>10} {"bytes/frame":>12}')
+    for name, fn in (('before', before), ('after', after)):
+        usec, allocated = measure(fn, frame, landmarks, args.frames)
+        print(f'{name:>8} {usec:>10.1f} {allocated:>12}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+The proctoring loop with its optional sinks against headless analysis.
+
+    python -m scripts.bench_headless --video clip.mp4 --frames 500 [--display]
+
+"before" runs the loop as it used to: every frame annotated, shown when
+--display is given, and a blocking 100 ms beep on every alert. "after" runs
+the headless engine, analysis only. Both process the same frames with
+their own Proctor; alerts are not written to the event log and evidence
+frames are saved to a throwaway directory.
+"""
+import argparse, tempfile, time
+import cv2
+import numpy as np
+from system.detection import Proctor
+from system.events import bus, events
+from system.evidence import evidence
+from system.registry import models, WORKER_MODELS
+from system.sinks import DisplaySink, winsound
+
+
+def load_frames(path, count):
+    if not path:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(count)]
+    video = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ok, frame = video.read()
+        if not ok:
+            if not frames:
+                raise SystemExit(f'could not read {path}')
+            video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            continue
+        frames.append(frame)
+    return frames
+
+
+def blocking_beep(alert):
+    if winsound is not None:
+        winsound.Beep(2500, 100)
+    else:
+        time.sleep(0.1)
+
+
+def run(frames, headless, display):
+    name = 'bench-headless' if headless else 'bench-annotated'
+    proctor = Proctor(name, 0, encoding_file='', annotate=not headless)
+    sink = DisplaySink() if display and not headless else None
+    if not headless:
+        bus.subscribe(blocking_beep, (name, 0))
+    times = []
+    try:
+        for frame in frames:
+            start = time.perf_counter()
+            frame = proctor.process(frame.copy())
+            if sink is not None:
+                sink.show(frame)
+            times.append(time.perf_counter() - start)
+    finally:
+        bus.unsubscribe(blocking_beep)
+        if sink is not None:
+            sink.close()
+    times = np.array(times) * 1000
+    return {'fps': len(times) / times.sum() * 1000, 'p50': np.percentile(times, 50),
+            'p99': np.percentile(times, 99), 'alerts': proctor.count}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--video')
+    parser.add_argument('--frames', type=int, default=500)
+    parser.add_argument('--display', action='store_true', help='show the frames in the "before" loop')
+    args = parser.parse_args()
+
+    frames = load_frames(args.video, args.frames)
+    models.warm_up(WORKER_MODELS)
+    bus.unsubscribe(events.record_alert)
+    evidence.root = tempfile.mkdtemp()
+
+    results = {}
+    print(f'{"":>8} {"fps":>7} {"p50 ms":>8} {"p99 ms":>8} {"alerts":>6}')
+    for label, headless in (('before', False), ('after', True)):
+        r = results[label] = run(frames, headless, args.display)
+        print(f'{label:>8} {r["fps"]:>7.1f} {r["p50"]:>8.2f} {r["p99"]:>8.2f} {r["alerts"]:>6}')
+    print(f'speedup: {results["after"]["fps"] / results["before"]["fps"]:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
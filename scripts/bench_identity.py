@@ -0,0 +1,64 @@
+"""
+1:N identity search latency from 1k to 100k enrolled encodings.
+
+    python -m scripts.bench_identity --sizes 1000 10000 50000 100000 --queries 200
+
+Enrolls random 128-d encodings (one per user, scaled like dlib's face
+encodings) and queries with noisy copies of enrolled rows. Reports
+index build time, per-query latency percentiles and top-1 recall for the
+exact search and for the IVF search.
+"""
+import argparse, time
+import numpy as np
+from system.identity import IdentityIndex
+
+
+class ArrayPacked(object):
+    """In-memory stand-in for PackedEncodings"""
+    DIM = 128
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.users = {f'user{i}': (i, i + 1) for i in range(len(matrix))}
+        self.version = 1
+
+
+def measure(index, queries, truth):
+    index.refresh()
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        (username, _), = index.search(query)
+        latencies.append(time.perf_counter() - start)
+        hits += username == expected
+    latencies = np.array(latencies) * 1000
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), hits / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--noise', type=float, default=0.02)
+    parser.add_argument('--nprobe', type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f'{"size":>7} {"index":>6} {"build s":>8} {"p50 ms":>7} {"p99 ms":>7} {"recall":>7}')
+    for size in args.sizes:
+        matrix = (rng.standard_normal((size, 128)) * 0.09).astype(np.float32)
+        picks = rng.choice(size, args.queries)
+        queries = matrix[picks] + (rng.standard_normal((args.queries, 128)) * args.noise).astype(np.float32)
+        truth = [f'user{i}' for i in picks]
+        for name, partitions in (('exact', 0), ('ivf', int(np.sqrt(size)))):
+            index = IdentityIndex(ArrayPacked(matrix), partitions, args.nprobe)
+            start = time.perf_counter()
+            index.refresh()
+            build = time.perf_counter() - start
+            p50, p99, recall = measure(index, queries, truth)
+            print(f'{size:>7} {name:>6} {build:>8.2f} {p50:>7.2f} {p99:>7.2f} {recall:>7.3f}')
+
+
+if __name__ == '__main__':
+    main()
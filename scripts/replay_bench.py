@@ -0,0 +1,224 @@
+"""
+Offline replay of the proctoring pipeline, without a webcam or a browser.
+
+    python -m scripts.replay_bench --video clip.mp4 --frames 600
+    python -m scripts.replay_bench --synthetic --frames 600 --seed 0
+    python -m scripts.replay_bench --video clip.mp4 --scale 1 2 4 8 16 --workers 2 --duration 30
+
+Replay mode runs one session in this process: every frame goes through
+face detection, the SSD, gaze tracking and the event log, which writes to
+a throwaway SQLite database. Time is simulated at --fps, so the stages
+due on each frame, and hence the detections and alerts, are the same
+from run to run. Reports fps, p50/p99 per stage, peak RSS and the counts
+of detections and alerts by kind.
+
+Scaling mode proctors N concurrent sessions through the worker pool of
+the scheduler, each sent frames at --fps, and reports for each N the
+frames analysed per session per second, the share dropped by the ingest
+buffers, the worker latency and the workers' peak RSS. The capacity per
+core is the largest N that keeps up, divided by the number of workers.
+Simulated sessions use negative user and exam ids. In both modes alerts
+and evidence are logged to a throwaway database and directory, not the
+app's.
+"""
+import argparse, itertools, os, resource, sys, tempfile, time
+from collections import Counter, defaultdict
+import cv2
+import numpy as np
+from sqlalchemy import create_engine, func, select
+from system import app
+from system.detection import Proctor
+from system.events import bus, events
+from system.evidence import evidence
+from system.ingest import ingest
+from system.metrics import metrics, BUCKETS
+from system.models import ProctorEvent
+from system.registry import models, WORKER_MODELS
+from system.scheduler import ProctorScheduler
+
+
+def synthetic_frames(count, seed, width=640, height=480):
+    """A textured scene with a moving bright block, the same for a seed."""
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 5)
+    frames = []
+    for n in range(count):
+        frame = background.copy()
+        x = int((np.sin(n / 15) + 1) / 2 * (width - 120))
+        cv2.rectangle(frame, (x, height // 3), (x + 120, height // 3 + 160), (200, 200, 200), -1)
+        frames.append(frame)
+    return frames
+
+
+def video_frames(path, count):
+    video = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ok, frame = video.read()
+        if not ok:
+            if not frames:
+                raise SystemExit(f'could not read {path}')
+            video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            continue
+        frames.append(frame)
+    video.release()
+    return frames
+
+
+class SimulatedClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def replay(frames, fps, encoding_file):
+    # alerts and evidence go to a throwaway database and directory, not the app's
+    scratch = tempfile.mkdtemp()
+    engine = create_engine(f'sqlite:///{os.path.join(scratch, "events.db")}')
+    ProctorEvent.__table__.create(engine)
+    events.engine = engine
+    evidence.root = scratch
+    alerts = Counter()
+    bus.subscribe(lambda alert: alerts.update([alert.kind]))
+
+    clock = SimulatedClock()
+    proctor = Proctor('replay', 0, encoding_file=encoding_file or '', annotate=False, clock=clock)
+    stages = defaultdict(list)
+    detections = Counter()
+    totals = []
+    for n, frame in enumerate(frames):
+        clock.now = n / fps
+        start = time.perf_counter()
+        proctor.process(frame.copy())
+        totals.append(time.perf_counter() - start)
+        for stage, seconds in proctor.timer.timings.items():
+            stages[stage].append(seconds)
+        detections['faces'] += len(proctor.faces)
+        detections.update(proctor.classNames[track.label - 1] for track in proctor.objects.tracks if not track.missed)
+    events.flush()
+    proctor.timer.close()
+    with engine.connect() as conn:
+        logged = conn.execute(select([func.count()]).select_from(ProctorEvent.__table__)).scalar()
+
+    totals = np.array(totals)
+    print(f'{len(frames)} frames, {len(frames) / totals.sum():.1f} fps, '
+          f'peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB')
+    print(f'{"stage":>10} {"runs":>6} {"p50 ms":>8} {"p99 ms":>8}')
+    for stage, values in sorted(stages.items()) + [('total', list(totals))]:
+        values = np.array(values) * 1000
+        print(f'{stage:>10} {len(values):>6} {np.percentile(values, 50):>8.2f} {np.percentile(values, 99):>8.2f}')
+    print('detections (tracked objects summed over frames):', dict(sorted(detections.items())))
+    print('alerts:', dict(sorted(alerts.items())), f'logged: {logged}')
+
+
+def histogram_counts(snapshots, name):
+    """Bucket bounds and counts of a histogram summed over worker snapshots."""
+    counts, bounds = np.zeros(len(BUCKETS) + 1, np.int64), list(BUCKETS) + [float('inf')]
+    for snapshot in snapshots:
+        for (series, labels), (buckets, values, total, count) in snapshot['histograms']:
+            if series == name:
+                counts += values
+    return bounds, counts
+
+
+def percentile(bounds, counts, q):
+    """Upper bound of the bucket holding the q-th percentile."""
+    if not counts.sum():
+        return float('nan')
+    return bounds[int(np.searchsorted(np.cumsum(counts), q / 100 * counts.sum()))]
+
+
+def peak_rss(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def scale(frames, sessions, workers, fps, duration, warmup, run):
+    metrics._remote.clear()
+    scheduler = ProctorScheduler(workers, sessions, 16, 8, 0.02)
+    keys = [(-(i + 1), -(run + 1)) for i in range(sessions)]
+    for user_id, exam_id in keys:
+        scheduler.start(user_id, exam_id, (warmup + duration) / 60 + 5)
+    buffers = [ingest.get(key) for key in keys]
+
+    # frames sent while the workers load their models are not counted
+    start = time.perf_counter()
+    before = None
+    for n in itertools.count():
+        now = time.perf_counter() - start
+        if before is None and now >= warmup:
+            before = [buffer.stats() for buffer in buffers]
+            warm = list(metrics._remote.values())
+            measured = time.perf_counter()
+        if now >= warmup + duration:
+            break
+        for buffer in buffers:
+            buffer.push(frames[n % len(frames)])
+        time.sleep(max(0, start + (n + 1) / fps - time.perf_counter()))
+    elapsed = time.perf_counter() - measured
+    after = [buffer.stats() for buffer in buffers]
+    received = sum(a['received'] - b['received'] for a, b in zip(after, before))
+    dropped = sum(a['dropped'] - b['dropped'] for a, b in zip(after, before))
+    backlog = sum(a['depth'] - b['depth'] for a, b in zip(after, before))
+    time.sleep(app.config['METRICS_REPORT_INTERVAL'] + 1)
+    bounds, counts = histogram_counts(metrics._remote.values(), 'proctor_frame_latency_seconds')
+    counts -= histogram_counts(warm, 'proctor_frame_latency_seconds')[1]
+    rss = max(peak_rss(worker.process.pid) for worker in scheduler._pool)
+    for user_id, exam_id in keys:
+        scheduler.stop(user_id, exam_id)
+    for worker in scheduler._pool:
+        worker.process.terminate()
+    return {
+        'fps': (received - dropped - backlog) / elapsed / sessions,
+        'dropped': dropped / max(received, 1),
+        'p50': percentile(bounds, counts, 50),
+        'p99': percentile(bounds, counts, 99),
+        'rss': rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--video')
+    source.add_argument('--synthetic', action='store_true')
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fps', type=float, default=5, help='frame rate of the (simulated) students')
+    parser.add_argument('--encoding', help='encoding file of the student, enables identity checks')
+    parser.add_argument('--scale', type=int, nargs='+', help='numbers of concurrent sessions to try')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=30, help='seconds per scaling step')
+    parser.add_argument('--warmup', type=float, default=10, help='seconds sent before measuring a step')
+    args = parser.parse_args()
+
+    cv2.setRNGSeed(args.seed)
+    frames = video_frames(args.video, args.frames) if args.video else synthetic_frames(args.frames, args.seed)
+
+    if not args.scale:
+        models.warm_up(WORKER_MODELS)
+        replay(frames, args.fps, args.encoding)
+        return
+
+    # spawned workers read these when they import the app
+    scratch = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(scratch, "bench.db")}'
+    os.environ['EVIDENCE_ROOT'] = scratch
+    print(f'{"sessions":>8} {"fps/session":>11} {"dropped":>8} {"p50 ms":>8} {"p99 ms":>8} {"worker RSS MiB":>14}')
+    for run, sessions in enumerate(args.scale):
+        r = scale(frames, sessions, args.workers, args.fps, args.duration, args.warmup, run)
+        print(f'{sessions:>8} {r["fps"]:>11.2f} {r["dropped"]:>8.1%} {r["p50"] * 1000:>8.0f} '
+              f'{r["p99"] * 1000:>8.0f} {r["rss"] / 2**20:>14.0f}')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Replays a video file as a fake student browser against the frame ingest
+endpoint.
+
+    python -m scripts.replay_client clip.mp4 --user 2 --exam 1
+    python -m scripts.replay_client clip.mp4 --url http://host:5000 --cookie <session> --exam 1
+
+Without --url the requests go through the Flask test client in-process,
+logged in as --user, and --analyse proctors the received frames through
+the worker pool.
+"""
+import argparse, json, time, urllib.request
+import cv2
+from system import app
+from system.ingest import ingest, pack_chunk
+from system.scheduler import scheduler
+
+
+def encoded_frames(path, codec, quality, width, loop):
+    params = [cv2.IMWRITE_WEBP_QUALITY if codec == 'webp' else cv2.IMWRITE_JPEG_QUALITY, quality]
+    while True:
+        video = cv2.VideoCapture(path)
+        ok, frame = video.read()
+        if not ok:
+            raise SystemExit(f'Could not read frames from {path}')
+        while ok:
+            if width and frame.shape[1] != width:
+                frame = cv2.resize(frame, (width, int(frame.shape[0] * width / frame.shape[1])))
+            yield cv2.imencode('.' + codec, frame, params)[1].tobytes()
+            ok, frame = video.read()
+        video.release()
+        if not loop:
+            return
+
+
+def local_sender(user_id, exam_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    def send(body):
+        response = client.post(f'/ingest/{exam_id}', data=body, content_type='application/octet-stream')
+        return response.get_json()
+    return send
+
+
+def remote_sender(url, cookie, exam_id):
+    def send(body):
+        req = urllib.request.Request(f'{url.rstrip("/")}/ingest/{exam_id}', data=body, method='POST')
+        req.add_header('Content-Type', 'application/octet-stream')
+        req.add_header('Cookie', f'session={cookie}')
+        with urllib.request.urlopen(req) as response:
+            return json.loads(response.read())
+    return send
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video')
+    parser.add_argument('--exam', type=int, required=True)
+    parser.add_argument('--user', type=int, default=1)
+    parser.add_argument('--url')
+    parser.add_argument('--cookie')
+    parser.add_argument('--fps', type=float, default=5, help='0 sends as fast as possible')
+    parser.add_argument('--batch', type=int, default=5)
+    parser.add_argument('--codec', choices=['jpg', 'webp'], default='webp')
+    parser.add_argument('--quality', type=int, default=70)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--loop', action='store_true')
+    parser.add_argument('--analyse', action='store_true')
+    args = parser.parse_args()
+
+    if args.url:
+        send = remote_sender(args.url, args.cookie, args.exam)
+    else:
+        send = local_sender(args.user, args.exam)
+        if args.analyse:
+            scheduler.start(args.user, args.exam, 24 * 60)
+        else:
+            ingest.open((args.user, args.exam))
+
+    sent, sent_bytes, batch = 0, 0, []
+    start = time.perf_counter()
+    try:
+        for data in encoded_frames(args.video, args.codec, args.quality, args.width, args.loop):
+            batch.append(pack_chunk(data))
+            sent += 1
+            sent_bytes += len(data)
+            if len(batch) == args.batch:
+                print(send(b''.join(batch)))
+                batch = []
+            if args.fps:
+                time.sleep(max(0, start + sent / args.fps - time.perf_counter()))
+        if batch:
+            print(send(b''.join(batch)))
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.perf_counter() - start
+    print(f'{sent} frames, {sent_bytes / max(sent, 1) / 1024:.1f} KiB/frame, {sent / elapsed:.1f} frames/s')
+    if args.analyse:
+        print(scheduler.stats())
+        scheduler.stop(args.user, args.exam)
+    ingest.close((args.user, args.exam))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,10 +7,75 @@ from flask_mail import Mail
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = '5791628bb0b13ce0c676dfde280ba245'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
+# the database and the evidence directory can be set in the environment, which proctor workers inherit
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///site.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 app.config['UPLOAD_FOLDER'] = os.path.join(APP_ROOT, 'static', 'questions')
+# answers submitted this long after the end of an exam still count, for slow networks
+app.config['SUBMISSION_GRACE_SECONDS'] = 60
+# question banks kept in memory, rows per insert when importing an upload, and
+# whether each student sees the questions and options in an order of their own
+app.config['QUESTION_CACHE_SIZE'] = 64
+app.config['QUESTION_IMPORT_BATCH'] = 500
+app.config['QUESTION_SHUFFLE'] = False
+# share of a question's marks taken off for a wrong answer, 0 for none
+app.config['GRADING_NEGATIVE_MARKING'] = 0.0
+app.config['INGEST_BUFFER_FRAMES'] = 32
+app.config['INGEST_MAX_FRAME_BYTES'] = 1024 * 1024
+app.config['PROCTOR_WORKERS'] = os.cpu_count() or 1
+app.config['PROCTOR_SESSIONS_PER_WORKER'] = 8
+app.config['PROCTOR_FRAMES_IN_FLIGHT'] = 16
+app.config['PROCTOR_MAX_BATCH'] = 8
+app.config['PROCTOR_MAX_WAIT'] = 0.02
+# object detector used by the proctors, one of DETECTORS; model files are in static/models
+app.config['DETECTOR'] = 'ssd'
+app.config['DETECTORS'] = {
+    'ssd': {'backend': 'opencv', 'model': 'frozen_inference_graph.pb',
+            'config': 'ssd_mobilenet_v3_large_coco_2020_01_14.pbtxt', 'size': 320, 'threads': 1},
+    'ssd-onnx': {'backend': 'onnxruntime', 'model': 'ssd_mobilenet_v3_large.onnx', 'size': 320, 'threads': 1},
+    'ssd-int8': {'backend': 'onnxruntime', 'model': 'ssd_mobilenet_v3_large.int8.onnx', 'size': 320, 'threads': 1},
+}
+# classes the proctors look for, with their minimum scores; the alerts count as violations
+app.config['DETECTION_THRESHOLDS'] = {'person': 0.5, 'cell phone': 0.5, 'laptop': 0.5, 'book': 0.5,
+                                      'tv': 0.5, 'remote': 0.5, 'keyboard': 0.5}
+app.config['DETECTION_NMS_THRESHOLD'] = 0.2
+app.config['DETECTION_ALERTS'] = ['cell phone', 'laptop']
+# run each analysis stage on every Nth frame, relaxed while the scene is static
+app.config['PROCTOR_CADENCE'] = {'faces': 1, 'gaze': 2, 'objects': 3}
+app.config['PROCTOR_MOTION_THRESHOLD'] = 3.0
+app.config['PROCTOR_STATIC_EVERY'] = 10
+app.config['PROCTOR_ESCALATION_SECONDS'] = 10
+# optional outputs of the proctor workers: 'annotate' draws onto the frames, 'display'
+# shows each session in a window and 'audio' beeps on its alerts; none on a server
+app.config['PROCTOR_SINKS'] = ()
+# a tracked face or object is dropped after this many detector runs without it
+app.config['TRACK_MIN_IOU'] = 0.3
+app.config['TRACK_MAX_MISSED'] = 2
+# how often each session's status and thumbnail reach the live dashboard, in seconds
+app.config['DASHBOARD_STATUS_INTERVAL'] = 1.0
+app.config['DASHBOARD_THUMBNAIL_INTERVAL'] = 5.0
+app.config['DASHBOARD_THUMBNAIL_WIDTH'] = 160
+# workers send their metrics to the web process this often, in seconds
+app.config['METRICS_REPORT_INTERVAL'] = 5.0
+# a directory to append per-frame stage timings of each session to, as JSON lines
+app.config['PROCTOR_TRACE_DIR'] = None
+app.config['EVENT_LOG_MAX_PENDING'] = 10000
+app.config['EVENT_LOG_BATCH_SIZE'] = 200
+app.config['EVIDENCE_ROOT'] = os.environ.get('EVIDENCE_ROOT', os.path.join(APP_ROOT, 'static'))
+app.config['EVIDENCE_CODEC'] = 'jpg'
+app.config['EVIDENCE_QUALITY'] = 80
+app.config['EVIDENCE_MAX_WIDTH'] = 640
+app.config['EVIDENCE_MAX_PENDING'] = 32
+app.config['ENCODING_CACHE_SIZE'] = 1024
+app.config['MAX_REFERENCE_ENCODINGS'] = 5
+app.config['FACE_MATCH_TOLERANCE'] = 0.3
+# 0 searches all enrolled encodings exactly, otherwise the number of IVF lists
+app.config['IDENTITY_PARTITIONS'] = 0
+app.config['IDENTITY_NPROBE'] = 8
+# in-exam re-verification: at most one encoding pass per interval per session
+app.config['REVERIFY_INTERVAL'] = 5.0
+app.config['REVERIFY_MAX_AGE'] = 60.0
 db = SQLAlchemy(app)
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
@@ -23,4 +88,6 @@ app.config['MAIL_USERNAME'] = 'musicssns@gmail.com'
 app.config['MAIL_PASSWORD'] = 'Sarath@2206'
 mail = Mail(app)
 
-from system import routes
+from system import routes, commands
+
+db.create_all()
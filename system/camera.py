@@ -1,7 +1,13 @@
-import cv2, os, winsound
+import cv2, os
 from system import app
+from system.registry import models
 import numpy as np
 
+try:
+    import winsound
+except ImportError:
+    winsound = None
+
 
 BASE = os.path.join(app.root_path, 'static', 'models')
 
@@ -52,7 +58,8 @@ def detect_eyes(img, cascade):
 def store_activity(frame, category, name, exam, box, count=0, warnings=5):
     if category in ['CELL PHONE', 'LAPTOP']:
         count += 1
-        winsound.Beep(2500, 100)
+        if winsound is not None:
+            winsound.Beep(2500, 100)
         cv2.putText(frame, category, (box[0]+10,box[1]+30), cv2.FONT_HERSHEY_COMPLEX,1,(0,0,255),2)
         if count%warnings == 0:
             path = os.path.join(BASE, 'logs', str(exam.id), str(name), f'{count//warnings}.png')
@@ -61,11 +68,9 @@ def store_activity(frame, category, name, exam, box, count=0, warnings=5):
 
 
 def detect_objects(frame):
-    configPath = os.path.join(BASE, 'models', 'ssd_mobilenet_v3_large_coco_2020_01_14.pbtxt')
-    weightsPath = os.path.join(BASE, 'models', 'frozen_inference_graph.pb')
-    net = cv2.dnn_DetectionModel(weightsPath, configPath)
-    classNames= []
-    classIds, confs, bbox = net.detect(frame, confThreshold=0.5)
+    classNames = models.class_names
+    with models.lock('ssd_batch'):
+        classIds, confs, bbox = models.ssd_batch.detect([frame], 0.5)[0]
     bbox = list(bbox)
     confs = list(np.array(confs).reshape(1,-1)[0])
     confs = list(map(float,confs))
@@ -0,0 +1,90 @@
+import csv, os, time
+from concurrent.futures import ProcessPoolExecutor
+import click
+import face_recognition
+from system import app, db
+from system.models import User
+from system.encodings import encodings
+
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+
+def _photos(source):
+    """(username, path) pairs from a directory of <username>.<ext> photos
+    or a CSV with username and path columns."""
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            username, ext = os.path.splitext(name)
+            if ext.lower() in IMAGE_EXTENSIONS:
+                yield username, os.path.join(source, name)
+        return
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, newline='') as f:
+        for row in csv.DictReader(f):
+            yield row['username'], os.path.join(base, row['path'])
+
+
+def _encode(path):
+    try:
+        image = face_recognition.load_image_file(path)
+        found = face_recognition.face_encodings(image)
+    except Exception as e:
+        return None, str(e)
+    if len(found) != 1:
+        return None, f'{len(found)} faces found'
+    return found[0], None
+
+
+@app.cli.command('enroll-faces')
+@click.argument('source')
+@click.option('--workers', type=int, default=os.cpu_count(), help='Processes computing encodings.')
+def enroll_faces(source, workers):
+    """Enrolls the faces of existing users from a directory of
+    <username>.<ext> photos or a CSV of username,path rows."""
+    photos = list(_photos(source))
+    total = len(photos)
+    users = {user.username: user for user in User.query.filter(User.username.in_([u for u, _ in photos]))}
+    failures = [(username, 'unknown user') for username, _ in photos if username not in users]
+    photos = [(username, path) for username, path in photos if username in users]
+
+    start = time.perf_counter()
+    enrolled = {}
+    with ProcessPoolExecutor(workers) as pool:
+        results = pool.map(_encode, [path for _, path in photos], chunksize=8)
+        for (username, path), (encoding, error) in zip(photos, results):
+            if encoding is None:
+                failures.append((username, f'{path}: {error}'))
+            else:
+                enrolled[username] = encoding
+    elapsed = time.perf_counter() - start
+
+    if enrolled:
+        encodings.packed.append(enrolled)
+        for username in enrolled:
+            users[username].encoding_file = username + '.npy'
+        db.session.commit()
+
+    for username, error in failures:
+        click.echo(f'FAILED {username}: {error}', err=True)
+    click.echo(f'Enrolled {len(enrolled)} of {total} photos in {elapsed:.1f}s '
+               f'({len(photos) / elapsed if elapsed else 0:.1f} photos/s), {len(failures)} failed')
+
+
+@app.cli.command('compact-encodings')
+@click.option('--import-legacy', is_flag=True, help='Also pack users enrolled as separate .npy files.')
+def compact_encodings(import_legacy):
+    """Drops superseded rows from the packed encodings matrix."""
+    encodings.packed.refresh()
+    before = encodings.packed.rows
+    if import_legacy:
+        legacy = {}
+        for name in os.listdir(encodings.root):
+            key, ext = os.path.splitext(name)
+            if ext == '.npy' and key not in encodings.packed:
+                legacy[key] = encodings.get(name)
+        if legacy:
+            encodings.packed.append(legacy)
+        click.echo(f'Imported {len(legacy)} users from .npy files')
+    encodings.packed.compact()
+    click.echo(f'{before} rows -> {encodings.packed.rows} rows')
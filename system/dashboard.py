@@ -0,0 +1,115 @@
+import json, threading, time
+from collections import deque
+import cv2
+
+
+def encode_thumbnail(frame, width=160, quality=60):
+    height = frame.shape[0] * width // frame.shape[1]
+    small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    ok, data = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return data.tobytes() if ok else None
+
+
+class SessionSnapshot(object):
+    __slots__ = ('user_id', 'exam_id', 'status', 'alerts', 'thumbnail', 'thumbnail_version',
+                 'version', 'payload', 'updated', 'closed')
+
+    def __init__(self, user_id, exam_id, recent):
+        self.user_id = user_id
+        self.exam_id = exam_id
+        self.status = {}
+        self.alerts = deque(maxlen=recent)
+        self.thumbnail = None
+        self.thumbnail_version = 0
+        self.version = 0
+        self.payload = None
+        self.updated = None
+        self.closed = False
+
+
+class DashboardHub(object):
+    """
+    Latest state of every proctored session, for the live dashboard.
+
+    Workers send status updates, alerts and small JPEG thumbnails at a
+    throttled rate. Each update bumps a global version and serialises the
+    session's snapshot once; every viewer is then sent the JSON of the
+    sessions of its exam that changed since the version it last saw, so
+    the cost of an update does not grow with the number of viewers.
+    Thumbnails are fetched separately, by version, and cache well.
+    """
+
+    def __init__(self, recent=5, retain=3600):
+        self.recent = recent
+        self.retain = retain
+        self.version = 0
+        self.sessions = {}
+        self._changed = threading.Condition()
+
+    def publish(self, kind, key, payload, ts=None):
+        """Takes a worker message: 'status' (dict), 'alert' (dict),
+        'thumbnail' (JPEG bytes) or 'closed'."""
+        user_id, exam_id = key
+        with self._changed:
+            session = self.sessions.get(key)
+            if session is None:
+                session = self.sessions[key] = SessionSnapshot(user_id, exam_id, self.recent)
+            if kind == 'status':
+                session.status = payload
+            elif kind == 'alert':
+                session.alerts.append(payload)
+            elif kind == 'thumbnail':
+                session.thumbnail = payload
+                session.thumbnail_version += 1
+            elif kind == 'closed':
+                session.closed = True
+                # ended sessions stay on the dashboard for a while
+                expired = [k for k, s in self.sessions.items()
+                           if k != key and s.closed and s.updated + self.retain < time.time()]
+                for k in expired:
+                    del self.sessions[k]
+            else:
+                return
+            self.version += 1
+            session.version = self.version
+            session.updated = ts or time.time()
+            session.payload = json.dumps({
+                'user_id': user_id,
+                'status': session.status,
+                'alerts': list(session.alerts),
+                'thumbnail': session.thumbnail_version,
+                'updated': session.updated,
+                'closed': session.closed,
+            })
+            self._changed.notify_all()
+
+    def changes(self, exam_id, since=0, timeout=15.0):
+        """Waits up to `timeout` for updates of the exam's sessions after
+        version `since`. Returns (version, [JSON payloads])."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                changed = [s.payload for s in self.sessions.values() if s.exam_id == exam_id and s.version > since]
+                remaining = deadline - time.monotonic()
+                if changed or remaining <= 0:
+                    return self.version, changed
+                self._changed.wait(remaining)
+
+    def thumbnail(self, user_id, exam_id):
+        session = self.sessions.get((user_id, exam_id))
+        return session.thumbnail if session is not None else None
+
+    def stream(self, exam_id):
+        """Server-sent events for the dashboard of an exam, a snapshot of
+        all its sessions first, then their changes."""
+        version = 0
+        while True:
+            version, changed = self.changes(exam_id, version)
+            if not changed:
+                # keeps proxies from closing an idle stream
+                yield ': keep-alive\n\n'
+                continue
+            yield f'id: {version}\ndata: [{",".join(changed)}]\n\n'
+
+
+hub = DashboardHub()
@@ -1,113 +1,176 @@
-import cv2, dlib, winsound, os
-from datetime import datetime, timedelta
-import numpy as np
+import cv2, os, time
 from system.gaze_tracking import GazeTracking
 from system import app
-
-
-def detect_cheating(name, exam):
-
-    BASE = os.path.join(app.root_path, 'static')
-
-    temp = os.path.join(BASE, 'logs', str(exam.id), str(name))
-
-    try:
-        os.mkdir(temp)
-    except:
-        pass
-
-    start = datetime.now()
-
-    classNames= []
-    classFile = os.path.join(BASE, 'models', 'coco.names')
-    with open(classFile, 'rt') as f:
-        classNames = f.read().rstrip('\n').split('\n')
-
-    configPath = os.path.join(BASE, 'models', 'ssd_mobilenet_v3_large_coco_2020_01_14.pbtxt')
-    weightsPath = os.path.join(BASE, 'models', 'frozen_inference_graph.pb')
-    warnings = 5
-    count = 0
-    gaze = GazeTracking()
-    detector = dlib.get_frontal_face_detector()
-
-    net = cv2.dnn_DetectionModel(weightsPath, configPath)
-    net.setInputSize(320,320)
-    net.setInputScale(1.0/ 127.5)
-    net.setInputMean((127.5, 127.5, 127.5))
-    net.setInputSwapRB(True)
-
-    webcam = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-
-    while True:
-
-        if start + timedelta(minutes=exam.duration) == datetime.now():
-            break
-
-        ret, frame = webcam.read()
-
-        if not ret:
-            break
+from system.registry import models
+from system.sampling import AnalysisRateController
+from system.events import events, bus
+from system.metrics import metrics, StageTimer, trace_path
+from system.evidence import evidence
+from system.postprocess import DetectionFilter
+from system.tracking import IoUTracker
+from system.reverify import IdentityMonitor, encoding_file_for
+
+
+BASE = os.path.join(app.root_path, 'static')
+
+
+class Proctor(object):
+    """Analysis state of one exam session, fed one frame at a time."""
+
+    def __init__(self, name, exam_id, encoding_file=None, annotate=False, clock=time.monotonic):
+        self.name = name
+        self.exam_id = exam_id
+        # draw boxes and pupils onto the frames, only worth it when someone watches
+        self.annotate = annotate
+        self.count = 0
+
+        self.classNames = models.class_names
+        self.detector = models.face_detector
+        self.gaze = GazeTracking(self.detector, models.shape_predictor)
+        # a returning student skips pupil calibration
+        self.calibration = os.path.join(BASE, 'calibration', f'{name}.json')
+        self.calibrated = self.gaze.calibration.load(self.calibration)
+        # whether the gaze was last refreshed on a frame with only the student in it
+        self.gazed = False
+        self.net = models.ssd_batch
+        self.filter = DetectionFilter(self.classNames, app.config['DETECTION_THRESHOLDS'], app.config['DETECTION_NMS_THRESHOLD'])
+        self.alerts = {name.lower() for name in app.config['DETECTION_ALERTS']}
+        self.rate = AnalysisRateController(app.config['PROCTOR_CADENCE'],
+                                           app.config['PROCTOR_MOTION_THRESHOLD'],
+                                           app.config['PROCTOR_STATIC_EVERY'],
+                                           app.config['PROCTOR_ESCALATION_SECONDS'],
+                                           clock)
+        self.timer = StageTimer(metrics, trace_path(app.config['PROCTOR_TRACE_DIR'], name, exam_id))
+        self.faces = []
+        self.face_tracks = IoUTracker(app.config['TRACK_MIN_IOU'], app.config['TRACK_MAX_MISSED'])
+        self.objects = IoUTracker(app.config['TRACK_MIN_IOU'], app.config['TRACK_MAX_MISSED'])
+        if encoding_file is None:
+            encoding_file = encoding_file_for(name)
+        self.identity = IdentityMonitor(name, exam_id, encoding_file,
+                                        app.config['REVERIFY_INTERVAL'],
+                                        app.config['REVERIFY_MAX_AGE'],
+                                        app.config['FACE_MATCH_TOLERANCE'],
+                                        clock)
+
+    def plan(self, frame):
+        """Returns the analysis stages ('faces', 'objects', 'gaze') due on this frame."""
+        stages = self.rate.plan(frame)
+        for stage in self.rate.cadence:
+            metrics.inc('proctor_stage_runs_total' if stage in stages else 'proctor_stage_skips_total', stage=stage)
+        return stages
+
+    def process(self, frame, detections=None, stages=None):
+        """Analyses one frame. `detections` are this frame's SSD results
+        when it was part of a batch run by the caller, `stages` the result
+        of plan() for it."""
+        classNames = self.classNames
+        gaze = self.gaze
+        if stages is None:
+            stages = self.plan(frame)
+        timer = self.timer
+        timer.start()
 
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = detector(gray)
-
-        classIds, confs, bbox = net.detect(frame, confThreshold=0.5)
-        bbox = list(bbox)
-        confs = list(np.array(confs).reshape(1,-1)[0])
-        confs = list(map(float,confs))
-
-        indices = cv2.dnn.NMSBoxes(bbox, confs, 0.5, 0.2)
-        for i in indices:
-            i = i[0]
-            box = bbox[i]
-            x,y,w,h = box[0],box[1],box[2],box[3]
-            cv2.rectangle(frame, (x,y), (x+w,h+y), color=(0, 255, 0), thickness=2)
-            category = classNames[classIds[i][0]-1].upper()
-            cv2.putText(frame, category, (box[0]+10,box[1]+30), cv2.FONT_HERSHEY_COMPLEX,1,(0,255,0),2)
-            if category in ['CELL PHONE', 'LAPTOP'] or len(faces) > 1:
-                count += 1
-                winsound.Beep(2500, 100)
-                cv2.putText(frame, category, (box[0]+10,box[1]+30), cv2.FONT_HERSHEY_COMPLEX,1,(0,0,255),2)
-                if count%warnings == 0:
-                    path = os.path.join(BASE, 'logs', str(exam.id), str(name), f'{count//warnings}.png')
-                    cv2.imwrite(path, frame)
-                    print('Saved frame to file system')
-
-        i = 0
-        for face in faces:
+        timer.lap('convert')
+        # between face detector runs the last known faces stand in
+        if 'faces' in stages:
+            self.faces = self.detector(gray)
+            timer.lap('faces')
+            started = self.face_tracks.update([(f.left(), f.top(), f.right(), f.bottom()) for f in self.faces])
+            seen = [track for track in self.face_tracks.tracks if not track.missed]
+            self.identity.update(frame, seen)
+            timer.lap('identity')
+            # one violation per face joining the student, not per frame
+            extra = min(len(started), len(seen) - 1)
+            for track in started[len(started) - extra:]:
+                self._violation(frame, 'multiple faces', track)
+        faces = self.faces
+
+        # between SSD runs the tracked objects move by their last velocity
+        if 'objects' in stages:
+            if detections is None:
+                with models.lock('ssd_batch'):
+                    detections, = self.net.detect([frame], conf_threshold=self.filter.min_threshold)
+                timer.lap('ssd')
+            ids, scores, boxes = self.filter.apply(*detections)
+            for track in self.objects.update(boxes, ids, scores):
+                category = classNames[track.label-1].lower()
+                if category in self.alerts:
+                    self._violation(frame, category, track)
+        else:
+            self.objects.predict()
+        timer.lap('objects')
+
+        if self.annotate:
+            frame = self._draw(frame, faces)
+            timer.lap('annotate')
+
+        # gaze and pupil calibration follow the student alone: with other
+        # faces in view there is no telling whose eyes they would be
+        if 'gaze' in stages:
+            self.gazed = len(faces) == 1
+            if self.gazed:
+                gaze.refresh(frame, gray, faces[0])
+                if self.annotate:
+                    frame = gaze.annotated_frame()
+                    left_pupil = gaze.pupil_left_coords()
+                    right_pupil = gaze.pupil_right_coords()
+                    cv2.putText(frame, "Left pupil:  " + str(left_pupil), (50, 50), cv2.FONT_HERSHEY_DUPLEX, 0.5, (147, 58, 31), 1)
+                    cv2.putText(frame, "Right pupil: " + str(right_pupil), (50, 100), cv2.FONT_HERSHEY_DUPLEX, 0.5, (147, 58, 31), 1)
+                timer.lap('gaze')
+        timer.finish()
+
+        return frame
+
+    def status(self):
+        """Summary of the session for the live dashboard."""
+        gaze = self.gaze
+        state = None
+        if self.gazed and gaze.pupils_located:
+            if gaze.is_blinking():
+                state = 'blinking'
+            elif gaze.is_right():
+                state = 'right'
+            elif gaze.is_left():
+                state = 'left'
+            else:
+                state = 'center'
+        return {
+            'faces': len(self.faces),
+            'gaze': state,
+            'violations': self.count,
+            'identity': self.identity.verdict(),
+            'objects': sorted({self.classNames[track.label-1] for track in self.objects.tracks
+                               if self.classNames[track.label-1].lower() in self.alerts}),
+        }
+
+    def _draw(self, frame, faces):
+        classNames = self.classNames
+        for track in self.objects.tracks:
+            x,y,w,h = track.xywh()
+            category = classNames[track.label-1]
+            color = (0,0,255) if category.lower() in self.alerts else (0,255,0)
+            cv2.rectangle(frame, (x,y), (x+w,h+y), color=color, thickness=2)
+            cv2.putText(frame, f'{category.upper()} {track.id}', (x+10,y+30), cv2.FONT_HERSHEY_COMPLEX,1,color,2)
+
+        for i, face in enumerate(faces, 1):
             x, y = face.left(), face.top()
             x1, y1 = face.right(), face.bottom()
             cv2.rectangle(frame, (x, y), (x1, y1), (0, 255, 0), 2)
-            i += 1
             cv2.putText(frame, 'FACE '+str(i), (x-10, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-
-            gaze.refresh(frame)
-
-            frame = gaze.annotated_frame()
-            text = ""
-
-            if gaze.is_blinking():
-                text = "Blinking"
-            elif gaze.is_right():
-                text = "Looking right"
-            elif gaze.is_left():
-                text = "Looking left"
-            elif gaze.is_center():
-                text = "Looking center"
-
-            #cv2.putText(frame, text, (90, 60), cv2.FONT_HERSHEY_DUPLEX, 1.2, (147, 58, 31), 2)
-
-            left_pupil = gaze.pupil_left_coords()
-            right_pupil = gaze.pupil_right_coords()
-            cv2.putText(frame, "Left pupil:  " + str(left_pupil), (50, 50), cv2.FONT_HERSHEY_DUPLEX, 0.5, (147, 58, 31), 1)
-            cv2.putText(frame, "Right pupil: " + str(right_pupil), (50, 100), cv2.FONT_HERSHEY_DUPLEX, 0.5, (147, 58, 31), 1)
-
-        cv2.imshow("Live", frame)
-
-        if cv2.waitKey(1) == 27:
-            break
-
-    cv2.destroyAllWindows()
-    webcam.release()
-
-    return
+        return frame
+
+    def _violation(self, frame, kind, track):
+        """Counts a violation, once per track, with the frame that started it as evidence."""
+        self.count += 1
+        self.rate.escalate()
+        thumbnail = evidence.submit(f'logs/{self.exam_id}/{self.name}/{self.count}', frame)
+        bus.publish(self.exam_id, self.name, kind, track.confidence, track.xywh(), thumbnail)
+
+    def close(self):
+        events.flush()
+        self.timer.close()
+        if not self.calibrated:
+            os.makedirs(os.path.dirname(self.calibration), exist_ok=True)
+            self.gaze.calibration.save(self.calibration)
+        print(f'Session {self.name}/{self.exam_id} analysis: {self.rate.stats()}, identity: {self.identity.stats()}')
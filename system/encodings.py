@@ -0,0 +1,242 @@
+import json, os, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+from system import app
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class PackedEncodings(object):
+    """
+    All users' encodings as rows of one float32 matrix, memory-mapped from
+    a `<name>.<generation>.f32` data file, with an index in `<name>.json`
+    naming that file and mapping each username to its [start, stop) rows.
+    Lookups are slices of the mapping, so they do not copy. Appends write
+    new rows at the end of the matrix before publishing the new index.
+    Rows a user no longer points to stay in the file until compact()
+    writes a new one; publishing the index then switches readers to it.
+    """
+
+    DIM = 128
+
+    def __init__(self, root, name='packed'):
+        self.root = root
+        self.name = name
+        # the data file of indexes that do not name one
+        self.data_path = os.path.join(root, name + '.f32')
+        self.index_path = os.path.join(root, name + '.json')
+        self.lock_path = os.path.join(root, name + '.lock')
+        self.generation = 0
+        self.users = {}
+        self.rows = 0
+        self.matrix = np.empty((0, self.DIM), np.float32)
+        self._mtime = None
+        self._lock = threading.RLock()
+
+    def refresh(self):
+        """Remaps the matrix if another process published a new index."""
+        while True:
+            try:
+                mtime = os.stat(self.index_path).st_mtime_ns
+            except OSError:
+                return
+            if mtime == self._mtime:
+                return
+            with self._lock:
+                with open(self.index_path) as f:
+                    index = json.load(f)
+                rows = index['rows']
+                data_path = os.path.join(self.root, index.get('data', self.name + '.f32'))
+                matrix = np.empty((0, self.DIM), np.float32)
+                if rows:
+                    try:
+                        matrix = np.memmap(data_path, np.float32, 'r', shape=(rows, self.DIM))
+                    except FileNotFoundError:
+                        # compacted and removed since this index was read, unless the index is unchanged
+                        if os.stat(self.index_path).st_mtime_ns == mtime:
+                            raise
+                        continue
+                self.users = {user: tuple(span) for user, span in index['users'].items()}
+                self.rows = rows
+                self.matrix = matrix
+                self.data_path = data_path
+                self.generation = index.get('generation', 0)
+                self._mtime = mtime
+                return
+
+    @property
+    def version(self):
+        """Changes whenever a new index is published."""
+        self.refresh()
+        return self._mtime
+
+    def get(self, username):
+        self.refresh()
+        span = self.users.get(username)
+        if span is None:
+            return None
+        return self.matrix[span[0]:span[1]]
+
+    def __contains__(self, username):
+        self.refresh()
+        return username in self.users
+
+    def __len__(self):
+        self.refresh()
+        return len(self.users)
+
+    def append(self, entries):
+        """Stores encodings for several users at once.
+
+        Arguments:
+            entries (dict): username to a (n, 128) array, replacing the user's rows
+        """
+        with self._locked():
+            self.refresh()
+            users = dict(self.users)
+            rows = self.rows
+            with open(self.data_path, 'ab') as f:
+                # drop a partial write left behind by a crashed append
+                f.truncate(rows * self.DIM * 4)
+                for username, encodings in entries.items():
+                    encodings = np.atleast_2d(np.asarray(encodings, np.float32))
+                    f.write(encodings.tobytes())
+                    users[username] = (rows, rows + len(encodings))
+                    rows += len(encodings)
+            self._publish(users, rows, self.data_path, self.generation)
+
+    def compact(self):
+        """Writes a new data file with only the rows users point to. The
+        old file is left to readers that still map it and removed once the
+        new index is published."""
+        with self._locked():
+            self.refresh()
+            old = self.data_path
+            generation = self.generation + 1
+            data_path = os.path.join(self.root, f'{self.name}.{generation}.f32')
+            users, rows = {}, 0
+            with open(data_path, 'wb') as f:
+                for username, (start, stop) in self.users.items():
+                    f.write(np.ascontiguousarray(self.matrix[start:stop]).tobytes())
+                    users[username] = (rows, rows + stop - start)
+                    rows += stop - start
+                f.flush()
+                os.fsync(f.fileno())
+            self._publish(users, rows, data_path, generation)
+            try:
+                os.remove(old)
+            except OSError:
+                # never written, or still mapped where that cannot be removed
+                pass
+
+    def _publish(self, users, rows, data_path, generation):
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'dim': self.DIM, 'rows': rows, 'data': os.path.basename(data_path),
+                       'generation': generation, 'users': users}, f)
+        os.replace(tmp, self.index_path)
+        self.refresh()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class EncodingStore(object):
+    """
+    Users' reference face encodings, kept in memory. New encodings go to
+    the packed matrix; users enrolled before it have their own .npy file
+    of one or more 128-d encodings, which is cached here. Cached entries
+    are evicted least recently used first, and reloaded when the file's
+    mtime changes.
+    """
+
+    def __init__(self, root, capacity=1024, max_references=5):
+        self.root = root
+        self.packed = PackedEncodings(root)
+        self.capacity = capacity
+        self.max_references = max_references
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """Returns a (n, 128) array of the user's encodings, None if there are none.
+        Users in the packed matrix are served from it, others from their own file."""
+        packed = self.packed.get(self.key(filename))
+        if packed is not None:
+            self.hits += 1
+            return packed
+        path = os.path.join(self.root, filename)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self.invalidate(filename)
+            return None
+        with self._lock:
+            cached = self._cache.get(filename)
+            if cached is not None and cached[0] == mtime:
+                self._cache.move_to_end(filename)
+                self.hits += 1
+                return cached[1]
+        self.misses += 1
+        encodings = np.atleast_2d(np.asarray(np.load(path, allow_pickle=True), np.float64))
+        encodings.setflags(write=False)
+        with self._lock:
+            self._cache[filename] = (mtime, encodings)
+            self._cache.move_to_end(filename)
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+        return encodings
+
+    def add(self, filename, encoding):
+        """Adds a reference encoding for the user, keeping the newest
+        max_references of them."""
+        encodings = self.get(filename)
+        encoding = np.atleast_2d(np.asarray(encoding, np.float32))
+        if encodings is not None:
+            encoding = np.vstack([encodings, encoding])[-self.max_references:]
+        self.packed.append({self.key(filename): encoding})
+        self.invalidate(filename)
+        return encoding
+
+    @staticmethod
+    def key(filename):
+        return os.path.splitext(filename)[0]
+
+    def invalidate(self, filename):
+        with self._lock:
+            self._cache.pop(filename, None)
+
+
+def face_distances(encodings, references):
+    """Euclidean distance of every face encoding to every reference, (faces, references)."""
+    encodings = np.atleast_2d(encodings)
+    references = np.atleast_2d(references)
+    return np.linalg.norm(encodings[:, None, :] - references[None, :, :], axis=2)
+
+
+def match_faces(encodings, references, tolerance):
+    """For each face, whether it is within tolerance of any reference."""
+    if len(encodings) == 0 or len(references) == 0:
+        return np.zeros(len(encodings), bool)
+    return face_distances(encodings, references).min(axis=1) <= tolerance
+
+
+encodings = EncodingStore(os.path.join(app.root_path, 'static', 'encodings'),
+                          app.config['ENCODING_CACHE_SIZE'],
+                          app.config['MAX_REFERENCE_ENCODINGS'])
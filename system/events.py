@@ -0,0 +1,140 @@
+import queue, threading, time
+from collections import namedtuple
+from datetime import datetime
+from system import app, db
+from system.models import ProctorEvent
+from system.metrics import metrics
+
+
+Alert = namedtuple('Alert', 'exam_id user_id kind confidence bbox thumbnail timestamp')
+
+
+class EventBus(object):
+    """
+    Hands the alerts of the proctoring sessions to their subscribers: the
+    event log, and optionally sinks such as audio. Subscribers run on the
+    publishing thread, so they must queue anything slow for later.
+    """
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, session=None):
+        """Calls `callback(alert)` for every alert, or only for those of the
+        (user_id, exam_id) `session`."""
+        with self._lock:
+            self._subscribers = self._subscribers + [(callback, session)]
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [(fn, session) for fn, session in self._subscribers if fn != callback]
+
+    def publish(self, exam_id, user_id, kind, confidence=None, bbox=None, thumbnail=None, timestamp=None):
+        alert = Alert(exam_id, user_id, kind, confidence, bbox, thumbnail, timestamp or datetime.now())
+        for callback, session in self._subscribers:
+            if session is None or session == (user_id, exam_id):
+                try:
+                    callback(alert)
+                except Exception as e:
+                    print(f'Alert subscriber {callback} failed: {e}')
+        return alert
+
+
+class EventLog(object):
+    """
+    Append-only store of proctoring events. record() only queues the
+    event; a background thread inserts queued events in batches, so the
+    analysis loop never waits on the database. Events are dropped, and
+    counted, if the queue is full.
+    """
+
+    def __init__(self, max_pending=10000, batch_size=200, interval=1.0, engine=None):
+        self.batch_size = batch_size
+        # the application's database unless set
+        self.engine = engine
+        self.interval = interval
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def record(self, exam_id, user_id, kind, confidence=None, bbox=None, thumbnail=None, timestamp=None):
+        if self._thread is None:
+            self._start()
+        event = {
+            'exam_id': exam_id,
+            'user_id': user_id,
+            'timestamp': timestamp or datetime.now(),
+            'kind': kind,
+            'confidence': None if confidence is None else float(confidence),
+            'bbox': None if bbox is None else ','.join(str(int(v)) for v in bbox),
+            'thumbnail': thumbnail,
+        }
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def record_alert(self, alert):
+        self.record(*alert)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self.write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def write(self, rows):
+        try:
+            with (self.engine or db.engine).begin() as conn:
+                conn.execute(ProctorEvent.__table__.insert(), rows)
+            self.written += len(rows)
+        except Exception as e:
+            self.dropped += len(rows)
+            print(f'Could not store {len(rows)} proctoring events: {e}')
+
+    def flush(self, timeout=5.0):
+        """Waits until queued events have been written."""
+        end = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < end:
+            time.sleep(0.05)
+
+
+def session_events(exam_id, user_id, since=None, until=None):
+    query = ProctorEvent.query.filter(ProctorEvent.exam_id == exam_id, ProctorEvent.user_id == user_id)
+    if since is not None:
+        query = query.filter(ProctorEvent.timestamp >= since)
+    if until is not None:
+        query = query.filter(ProctorEvent.timestamp <= until)
+    return query.order_by(ProctorEvent.timestamp).all()
+
+
+events = EventLog(app.config['EVENT_LOG_MAX_PENDING'], app.config['EVENT_LOG_BATCH_SIZE'])
+bus = EventBus()
+bus.subscribe(events.record_alert)
+
+
+@metrics.collector
+def _collect_events(metrics):
+    metrics.set('event_log_pending', events._queue.qsize())
+    metrics.total('event_log_written_total', events.written)
+    metrics.total('event_log_dropped_total', events.dropped)
@@ -0,0 +1,91 @@
+import os, queue, threading, time
+import cv2
+from system import app
+from system.metrics import metrics
+
+
+class EvidenceWriter(object):
+    """
+    Saves violation frames from a dedicated thread so the analysis loop
+    only pays for a copy (or a downscale) of the frame. Frames are
+    encoded as JPEG or WebP at the configured quality. When the bounded
+    queue is full the frame is dropped and counted.
+    """
+
+    def __init__(self, root, codec='jpg', quality=80, max_width=640, max_pending=32):
+        self.root = root
+        self.codec = codec
+        self.params = [cv2.IMWRITE_WEBP_QUALITY if codec == 'webp' else cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.max_width = max_width
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, name, frame):
+        """Queues the frame to be saved as `name` plus the codec's extension,
+        relative to the root. Returns that path, or None if it was dropped."""
+        if self._thread is None:
+            self._start()
+        if self._queue.full():
+            self.dropped += 1
+            return None
+        height, width = frame.shape[:2]
+        if self.max_width and width > self.max_width:
+            frame = cv2.resize(frame, (self.max_width, height * self.max_width // width), interpolation=cv2.INTER_AREA)
+        else:
+            frame = frame.copy()
+        path = f'{name}.{self.codec}'
+        try:
+            self._queue.put_nowait((path, frame))
+        except queue.Full:
+            self.dropped += 1
+            return None
+        return path
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            path, frame = self._queue.get()
+            start = time.perf_counter()
+            try:
+                ok, data = cv2.imencode('.' + self.codec, frame, self.params)
+                if not ok:
+                    raise ValueError(f'{self.codec} encoding failed')
+                path = os.path.join(self.root, path)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                self.written += 1
+                metrics.observe('evidence_write_seconds', time.perf_counter() - start)
+            except Exception as e:
+                self.dropped += 1
+                print(f'Could not save evidence frame {path}: {e}')
+            finally:
+                self._queue.task_done()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {'written': self.written, 'dropped': self.dropped, 'pending': self.pending()}
+
+
+evidence = EvidenceWriter(app.config['EVIDENCE_ROOT'],
+                          app.config['EVIDENCE_CODEC'],
+                          app.config['EVIDENCE_QUALITY'],
+                          app.config['EVIDENCE_MAX_WIDTH'],
+                          app.config['EVIDENCE_MAX_PENDING'])
+
+
+@metrics.collector
+def _collect_evidence(metrics):
+    metrics.set('evidence_pending', evidence.pending())
+    metrics.total('evidence_written_total', evidence.written)
+    metrics.total('evidence_dropped_total', evidence.dropped)
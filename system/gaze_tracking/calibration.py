@@ -1,5 +1,7 @@
 from __future__ import division
+import json, os
 import cv2
+import numpy as np
 from .pupil import Pupil
 
 
@@ -9,6 +11,8 @@ class Calibration(object):
     best binarization threshold value for the person and the webcam.
     """
 
+    THRESHOLDS = np.arange(5, 100, 5)
+
     def __init__(self):
         self.nb_frames = 20
         self.thresholds_left = []
@@ -48,18 +52,21 @@ class Calibration(object):
         """Calculates the optimal threshold to binarize the
         frame for the given eye.
 
+        The frame is filtered once and the iris size for every candidate
+        threshold is read off its cumulative histogram: binarizing turns
+        black exactly the pixels that are not above the threshold.
+
         Argument:
             eye_frame (numpy.ndarray): Frame of the eye to be analyzed
         """
         average_iris_size = 0.48
-        trials = {}
 
-        for threshold in range(5, 100, 5):
-            iris_frame = Pupil.image_processing(eye_frame, threshold)
-            trials[threshold] = Calibration.iris_size(iris_frame)
+        frame = Pupil.filter(eye_frame)[5:-5, 5:-5]
+        nb_pixels = max(frame.size, 1)
+        blacks = np.cumsum(np.bincount(frame.ravel(), minlength=256))[Calibration.THRESHOLDS]
+        iris_sizes = blacks / nb_pixels
 
-        best_threshold, iris_size = min(trials.items(), key=(lambda p: abs(p[1] - average_iris_size)))
-        return best_threshold
+        return int(Calibration.THRESHOLDS[np.argmin(np.abs(iris_sizes - average_iris_size))])
 
     def evaluate(self, eye_frame, side):
         """Improves calibration by taking into consideration the
@@ -75,3 +82,34 @@ class Calibration(object):
             self.thresholds_left.append(threshold)
         elif side == 1:
             self.thresholds_right.append(threshold)
+
+    def save(self, path):
+        """Stores a completed calibration so it can be reused.
+
+        Argument:
+            path (str): JSON file to write
+        """
+        if not self.is_complete():
+            return False
+        with open(path, 'w') as f:
+            json.dump({'left': self.thresholds_left, 'right': self.thresholds_right}, f)
+        return True
+
+    def load(self, path):
+        """Restores a calibration stored by save(). Returns true if the
+        calibration is complete afterwards.
+
+        Argument:
+            path (str): JSON file to read
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            self.thresholds_left = [int(t) for t in data['left']]
+            self.thresholds_right = [int(t) for t in data['right']]
+        except (ValueError, KeyError, TypeError):
+            self.thresholds_left = []
+            self.thresholds_right = []
+        return self.is_complete()
@@ -4,6 +4,36 @@ import cv2
 from .pupil import Pupil
 
 
+def landmarks_to_array(landmarks):
+    """Converts dlib landmarks to a (68, 2) array of int32 (x, y) points
+
+    Argument:
+        landmarks (dlib.full_object_detection): Facial landmarks for the face region
+    """
+    return np.array([(point.x, point.y) for point in landmarks.parts()], np.int32)
+
+
+class EyeBuffers(object):
+    """
+    Scratch arrays reused by Eye across frames, one set per side. They
+    grow to the largest eye box seen and are handed out as views, so a
+    steady stream of frames does not allocate for masking.
+    """
+
+    def __init__(self):
+        self._mask = [np.empty((0, 0), np.uint8), np.empty((0, 0), np.uint8)]
+        self._eye = [np.empty((0, 0), np.uint8), np.empty((0, 0), np.uint8)]
+
+    def get(self, side, height, width):
+        """Returns (mask, eye) views of the given shape for the given side"""
+        mask = self._mask[side]
+        if mask.shape[0] < height or mask.shape[1] < width:
+            shape = (max(mask.shape[0], height), max(mask.shape[1], width))
+            self._mask[side] = np.empty(shape, np.uint8)
+            self._eye[side] = np.empty(shape, np.uint8)
+        return self._mask[side][:height, :width], self._eye[side][:height, :width]
+
+
 class Eye(object):
     """
     This class creates a new frame to isolate the eye and
@@ -13,72 +43,87 @@ class Eye(object):
     LEFT_EYE_POINTS = [36, 37, 38, 39, 40, 41]
     RIGHT_EYE_POINTS = [42, 43, 44, 45, 46, 47]
 
-    def __init__(self, original_frame, landmarks, side, calibration):
+    def __init__(self, original_frame, landmarks, side, calibration, buffers=None):
+        """
+        Arguments:
+            original_frame (numpy.ndarray): Grayscale frame containing the face
+            landmarks: Facial landmarks, as dlib.full_object_detection or (68, 2) array
+            side: Indicates whether it's the left eye (0) or the right eye (1)
+            calibration (calibration.Calibration): Manages the binarization threshold value
+            buffers (EyeBuffers): Scratch arrays reused across frames (optional). The
+                eye frame is then only valid until the next frame is analyzed.
+        """
         self.frame = None
         self.origin = None
         self.center = None
         self.pupil = None
 
-        self._analyze(original_frame, landmarks, side, calibration)
+        if not isinstance(landmarks, np.ndarray):
+            landmarks = landmarks_to_array(landmarks)
+        if buffers is None:
+            buffers = EyeBuffers()
+
+        self._analyze(original_frame, landmarks, side, calibration, buffers)
 
     @staticmethod
     def _middle_point(p1, p2):
         """Returns the middle point (x,y) between two points
 
         Arguments:
-            p1 (dlib.point): First point
-            p2 (dlib.point): Second point
+            p1 (numpy.ndarray): First point
+            p2 (numpy.ndarray): Second point
         """
-        x = int((p1.x + p2.x) / 2)
-        y = int((p1.y + p2.y) / 2)
+        x = int((p1[0] + p2[0]) / 2)
+        y = int((p1[1] + p2[1]) / 2)
         return (x, y)
 
-    def _isolate(self, frame, landmarks, points):
+    def _isolate(self, frame, region, side, buffers):
         """Isolate an eye, to have a frame without other part of the face.
 
+        Only the bounding box of the eye is masked: pixels of the box outside
+        the eye contour are set to white, like the rest of the frame would be.
+
         Arguments:
             frame (numpy.ndarray): Frame containing the face
-            landmarks (dlib.full_object_detection): Facial landmarks for the face region
-            points (list): Points of an eye (from the 68 Multi-PIE landmarks)
+            region (numpy.ndarray): Points of an eye, (6, 2) array
+            side: Indicates whether it's the left eye (0) or the right eye (1)
+            buffers (EyeBuffers): Scratch arrays for the mask and the eye frame
         """
-        region = np.array([(landmarks.part(point).x, landmarks.part(point).y) for point in points])
-        region = region.astype(np.int32)
-
-        # Applying a mask to get only the eye
-        height, width = frame.shape[:2]
-        black_frame = np.zeros((height, width), np.uint8)
-        mask = np.full((height, width), 255, np.uint8)
-        cv2.fillPoly(mask, [region], (0, 0, 0))
-        eye = cv2.bitwise_not(black_frame, frame.copy(), mask=mask)
-
         # Cropping on the eye
         margin = 5
-        min_x = np.min(region[:, 0]) - margin
-        max_x = np.max(region[:, 0]) + margin
-        min_y = np.min(region[:, 1]) - margin
-        max_y = np.max(region[:, 1]) + margin
+        height, width = frame.shape[:2]
+        min_x = max(int(region[:, 0].min()) - margin, 0)
+        max_x = min(int(region[:, 0].max()) + margin, width)
+        min_y = max(int(region[:, 1].min()) - margin, 0)
+        max_y = min(int(region[:, 1].max()) + margin, height)
+        roi = frame[min_y:max_y, min_x:max_x]
+
+        # Applying a mask to get only the eye
+        mask, eye = buffers.get(side, roi.shape[0], roi.shape[1])
+        mask.fill(255)
+        cv2.fillPoly(mask, [(region - (min_x, min_y)).astype(np.int32)], 0)
+        np.maximum(roi, mask, out=eye)
 
-        self.frame = eye[min_y:max_y, min_x:max_x]
+        self.frame = eye
         self.origin = (min_x, min_y)
 
         height, width = self.frame.shape[:2]
         self.center = (width / 2, height / 2)
 
-    def _blinking_ratio(self, landmarks, points):
+    def _blinking_ratio(self, region):
         """Calculates a ratio that can indicate whether an eye is closed or not.
         It's the division of the width of the eye, by its height.
 
         Arguments:
-            landmarks (dlib.full_object_detection): Facial landmarks for the face region
-            points (list): Points of an eye (from the 68 Multi-PIE landmarks)
+            region (numpy.ndarray): Points of an eye, (6, 2) array
 
         Returns:
             The computed ratio
         """
-        left = (landmarks.part(points[0]).x, landmarks.part(points[0]).y)
-        right = (landmarks.part(points[3]).x, landmarks.part(points[3]).y)
-        top = self._middle_point(landmarks.part(points[1]), landmarks.part(points[2]))
-        bottom = self._middle_point(landmarks.part(points[5]), landmarks.part(points[4]))
+        left = region[0]
+        right = region[3]
+        top = self._middle_point(region[1], region[2])
+        bottom = self._middle_point(region[5], region[4])
 
         eye_width = math.hypot((left[0] - right[0]), (left[1] - right[1]))
         eye_height = math.hypot((top[0] - bottom[0]), (top[1] - bottom[1]))
@@ -90,15 +135,16 @@ class Eye(object):
 
         return ratio
 
-    def _analyze(self, original_frame, landmarks, side, calibration):
+    def _analyze(self, original_frame, landmarks, side, calibration, buffers):
         """Detects and isolates the eye in a new frame, sends data to the calibration
         and initializes Pupil object.
 
         Arguments:
             original_frame (numpy.ndarray): Frame passed by the user
-            landmarks (dlib.full_object_detection): Facial landmarks for the face region
+            landmarks (numpy.ndarray): Facial landmarks for the face region, (68, 2) array
             side: Indicates whether it's the left eye (0) or the right eye (1)
             calibration (calibration.Calibration): Manages the binarization threshold value
+            buffers (EyeBuffers): Scratch arrays for the mask and the eye frame
         """
         if side == 0:
             points = self.LEFT_EYE_POINTS
@@ -107,8 +153,9 @@ class Eye(object):
         else:
             return
 
-        self.blinking = self._blinking_ratio(landmarks, points)
-        self._isolate(original_frame, landmarks, points)
+        region = landmarks[points]
+        self.blinking = self._blinking_ratio(region)
+        self._isolate(original_frame, region, side, buffers)
 
         if not calibration.is_complete():
             calibration.evaluate(self.frame, side)
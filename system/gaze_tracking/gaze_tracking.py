@@ -2,7 +2,7 @@ from __future__ import division
 import os
 import cv2
 import dlib
-from .eye import Eye
+from .eye import Eye, EyeBuffers, landmarks_to_array
 from .calibration import Calibration
 
 
@@ -13,19 +13,29 @@ class GazeTracking(object):
     and pupils and allows to know if the eyes are open or closed
     """
 
-    def __init__(self):
+    def __init__(self, face_detector=None, predictor=None):
+        """
+        Arguments:
+            face_detector: Shared dlib frontal face detector (optional)
+            predictor (dlib.shape_predictor): Shared 68 landmarks predictor (optional)
+        """
         self.frame = None
         self.eye_left = None
         self.eye_right = None
         self.calibration = Calibration()
+        self._buffers = EyeBuffers()
 
         # _face_detector is used to detect faces
-        self._face_detector = dlib.get_frontal_face_detector()
+        if face_detector is None:
+            face_detector = dlib.get_frontal_face_detector()
+        self._face_detector = face_detector
 
         # _predictor is used to get facial landmarks of a given face
-        cwd = os.path.abspath(os.path.dirname(__file__))
-        model_path = os.path.abspath(os.path.join(cwd, "trained_models/shape_predictor_68_face_landmarks.dat"))
-        self._predictor = dlib.shape_predictor(model_path)
+        if predictor is None:
+            cwd = os.path.abspath(os.path.dirname(__file__))
+            model_path = os.path.abspath(os.path.join(cwd, "trained_models/shape_predictor_68_face_landmarks.dat"))
+            predictor = dlib.shape_predictor(model_path)
+        self._predictor = predictor
 
     @property
     def pupils_located(self):
@@ -39,28 +49,42 @@ class GazeTracking(object):
         except Exception:
             return False
 
-    def _analyze(self):
-        """Detects the face and initialize Eye objects"""
-        frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
-        faces = self._face_detector(frame)
+    def _analyze(self, gray=None, face=None):
+        """Detects the face and initialize Eye objects
+
+        Arguments:
+            gray (numpy.ndarray): Grayscale version of the frame (optional)
+            face (dlib.rectangle): Face to analyze, detected when not given (optional)
+        """
+        if gray is None:
+            gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
 
         try:
-            landmarks = self._predictor(frame, faces[0])
-            self.eye_left = Eye(frame, landmarks, 0, self.calibration)
-            self.eye_right = Eye(frame, landmarks, 1, self.calibration)
+            if face is None:
+                face = self._face_detector(gray)[0]
+            landmarks = landmarks_to_array(self._predictor(gray, face))
+            self.eye_left = Eye(gray, landmarks, 0, self.calibration, self._buffers)
+            self.eye_right = Eye(gray, landmarks, 1, self.calibration, self._buffers)
 
         except IndexError:
             self.eye_left = None
             self.eye_right = None
 
-    def refresh(self, frame):
+    def refresh(self, frame, gray=None, face=None):
         """Refreshes the frame and analyzes it.
 
+        Passing the grayscale frame and a face found by the caller's own
+        detector skips the conversion and the face detection here, so a
+        frame with several faces can be gazed face by face at the cost of
+        the landmark predictor only.
+
         Arguments:
             frame (numpy.ndarray): The frame to analyze
+            gray (numpy.ndarray): Grayscale version of the frame (optional)
+            face (dlib.rectangle): Face to analyze (optional)
         """
         self.frame = frame
-        self._analyze()
+        self._analyze(gray, face)
 
     def pupil_left_coords(self):
         """Returns the coordinates of the left pupil"""
@@ -0,0 +1,162 @@
+import csv, os
+import numpy as np
+from sqlalchemy import bindparam
+from system import app, db
+from system.models import UserExam, Question, Option, Response
+from system.questions import OPTIONS, question_banks, load_questions
+
+
+CODES = {letter: i + 1 for i, letter in enumerate(OPTIONS)}
+
+
+def encode_answers(responses):
+    """Answers as codes into a credit array's columns: 0 for a question
+    left blank, 1-4 for A-D."""
+    return np.array([CODES.get(response, 0) for response in responses], np.uint8)
+
+
+def decode_answers(codes):
+    """Letters of answer codes, '' for a question left blank."""
+    return [OPTIONS[code - 1] if code else '' for code in codes]
+
+
+class AnswerKey(object):
+    """
+    The marks of every possible answer to every question of an exam, as
+    a (questions, 1 + options) array. Grading looks up the marks of each
+    answer of a (submissions, questions) array of codes in one indexing
+    step and sums them per submission.
+
+    Arguments:
+        credit (np.ndarray): share of a question's marks for each answer, NaN for a wrong one
+        marks (float): total marks of the exam, split evenly between the questions
+        negative (float): share of a question's marks taken off for a wrong answer
+    """
+
+    def __init__(self, credit, marks, negative=0.0):
+        self.per_question = marks / max(len(credit), 1)
+        self.marks = np.where(np.isnan(credit), -negative, credit) * self.per_question
+        self._rows = np.arange(len(credit))
+
+    @classmethod
+    def for_exam(cls, exam, bank=None):
+        if bank is None:
+            bank = question_banks.get(exam)
+        return cls(bank.credit, exam.marks, app.config['GRADING_NEGATIVE_MARKING'])
+
+    def question_marks(self, answers):
+        """Marks of each answer, (submissions, questions)."""
+        return self.marks[self._rows, np.atleast_2d(answers)]
+
+    def grade(self, answers):
+        """Scores of a (submissions, questions) array of answer codes, never below 0."""
+        return np.maximum(self.question_marks(answers).sum(axis=1), 0)
+
+
+def _legacy_answers(path):
+    # attempts submitted before the response table have a CSV of one answer per row
+    path = os.path.join(app.root_path, 'static', 'responses', str(path))
+    with open(path, newline='') as f:
+        return encode_answers(row[0] if row else None for row in csv.reader(f))
+
+
+def load_answers(exam_id, attempts, questions):
+    """Answer codes of several attempts of an exam, (attempts, questions),
+    read with one query on the exam's responses."""
+    packed = dict(db.session.query(Response.attempt_id, Response.answers).filter(Response.exam_id == exam_id))
+    answers = np.zeros((len(attempts), questions), np.uint8)
+    for i, attempt in enumerate(attempts):
+        if attempt.id in packed:
+            codes = np.frombuffer(packed[attempt.id], np.uint8)
+        elif attempt.attempted_file:
+            codes = _legacy_answers(attempt.attempted_file)
+        else:
+            continue
+        answers[i, :len(codes)] = codes[:questions]
+    return answers
+
+
+def attempt_answers(attempt, questions):
+    """Answer codes of one attempt, (questions,)."""
+    answers = np.zeros(questions, np.uint8)
+    if attempt.response is not None:
+        codes = np.frombuffer(attempt.response.answers, np.uint8)
+    elif attempt.attempted_file:
+        codes = _legacy_answers(attempt.attempted_file)
+    else:
+        return answers
+    answers[:len(codes)] = codes[:questions]
+    return answers
+
+
+def answer_counts(exam_id, questions):
+    """How many attempts gave each answer to each question, (questions, 1 + options)."""
+    rows = [packed for packed, in db.session.query(Response.answers).filter(Response.exam_id == exam_id)]
+    answers = np.zeros((len(rows), questions), np.uint8)
+    for i, packed in enumerate(rows):
+        codes = np.frombuffer(packed, np.uint8)[:questions]
+        answers[i, :len(codes)] = codes
+    width = len(OPTIONS) + 1
+    cells = (np.arange(questions) * width + answers).ravel()
+    return np.bincount(cells, minlength=questions * width).reshape(questions, width)
+
+
+def regrade(exam):
+    """Recomputes the marks of every attempt of an exam that was not marked
+    by hand, in one pass over their answers and one batched update, in
+    the current transaction. The key is read from the tables, not the
+    cache, so that a fix not yet committed is used. Returns the number of
+    attempts regraded."""
+    attempts = UserExam.query.filter_by(exam_id=exam.id, attempted=True, corrected=False).all()
+    if not attempts:
+        return 0
+    key = AnswerKey.for_exam(exam, load_questions(exam.id))
+    scores = key.grade(load_answers(exam.id, attempts, len(key.marks)))
+    table = UserExam.__table__
+    db.session.execute(table.update().where(table.c.id == bindparam('attempt')).values(marks=bindparam('score')),
+                       [{'attempt': attempt.id, 'score': float(score)} for attempt, score in zip(attempts, scores)])
+    db.session.expire_all()
+    return len(attempts)
+
+
+def update_key(exam, correct, credit):
+    """Changes the answer key of an exam and regrades its attempts, in the
+    current transaction. Returns (questions changed, attempts regraded);
+    the exam's cached bank is stale once the transaction is committed.
+
+    Arguments:
+        correct (dict): question position to its correct letter
+        credit (dict): (position, letter) to the share of the marks for that option, None for the default
+    """
+    questions = Question.query.filter_by(exam_id=exam.id).all()
+    by_id = {question.id: question for question in questions}
+    changed = set()
+    fixes = [{'question': question.id, 'letter': correct[question.position]} for question in questions
+             if correct.get(question.position, question.correct) != question.correct]
+    if fixes:
+        table = Question.__table__
+        db.session.execute(table.update().where(table.c.id == bindparam('question')).values(correct=bindparam('letter')),
+                           fixes)
+        changed.update(fix['question'] for fix in fixes)
+    shares = []
+    for option in Option.query.filter(Option.question_id.in_(by_id)):
+        share = credit.get((by_id[option.question_id].position, option.letter), option.credit)
+        if share != option.credit:
+            shares.append({'option': option.id, 'share': share})
+            changed.add(option.question_id)
+    if shares:
+        table = Option.__table__
+        db.session.execute(table.update().where(table.c.id == bindparam('option')).values(credit=bindparam('share')),
+                           shares)
+    if not changed:
+        return 0, 0
+    return len(changed), regrade(exam)
+
+
+def partial_credit(exam_id):
+    """The options of an exam given a share of the marks by hand, as
+    (position, letter) to share."""
+    return {(position, letter): credit for position, letter, credit in
+            db.session.query(Question.position, Option.letter, Option.credit)
+            .join(Question, Question.id == Option.question_id)
+            .filter(Question.exam_id == exam_id, Option.credit.isnot(None))}
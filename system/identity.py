@@ -0,0 +1,121 @@
+import threading
+import numpy as np
+from system import app
+from system.encodings import encodings
+
+
+class IdentityIndex(object):
+    """
+    Nearest enrolled user for face encodings, over every user in the
+    packed encodings matrix.
+
+    The exact search computes all squared distances with one matrix
+    product, |q|^2 + |x|^2 - 2 q.x. With `partitions` set, rows are
+    clustered by k-means into that many lists (IVF). A query then scans
+    only the `nprobe` lists with the nearest centroids, trading a little
+    recall for speed on large enrolments. The index follows the packed
+    matrix: new enrolments are assigned to the existing centroids, which
+    are retrained once the number of rows has doubled.
+    """
+
+    def __init__(self, packed, partitions=0, nprobe=8, iterations=10, seed=0):
+        self.packed = packed
+        self.partitions = partitions
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.seed = seed
+        self.usernames = []
+        self.vectors = np.empty((0, packed.DIM), np.float32)
+        self.owners = np.empty(0, np.int32)
+        self.norms = np.empty(0, np.float32)
+        self.centroids = None
+        self.lists = []
+        self._trained_rows = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        version = self.packed.version
+        if self._version == version:
+            return
+        with self._lock:
+            if self._version == version:
+                return
+            self.build(self.packed.users, self.packed.matrix)
+            self._version = version
+
+    def build(self, users, matrix):
+        """Indexes the rows of `matrix` owned by `users` (username to [start, stop))."""
+        usernames = sorted(users)
+        spans = [users[u] for u in usernames]
+        self.vectors = np.concatenate([np.asarray(matrix[a:b], np.float32) for a, b in spans]) \
+            if spans else np.empty((0, self.packed.DIM), np.float32)
+        self.owners = np.repeat(np.arange(len(usernames), dtype=np.int32), [b - a for a, b in spans])
+        self.norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        self.usernames = usernames
+        if self.partitions and len(self.vectors) > self.partitions:
+            if self.centroids is None or len(self.vectors) >= 2 * self._trained_rows:
+                self.centroids = self._kmeans(self.vectors)
+                self._trained_rows = len(self.vectors)
+            assignment = self._nearest_centroids(self.vectors, 1)[:, 0]
+            order = np.argsort(assignment, kind='stable')
+            bounds = np.searchsorted(assignment[order], np.arange(len(self.centroids) + 1))
+            self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        else:
+            self.centroids = None
+            self.lists = []
+
+    def _kmeans(self, vectors):
+        rng = np.random.default_rng(self.seed)
+        centroids = vectors[rng.choice(len(vectors), self.partitions, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignment = _squared_distances(vectors, centroids).argmin(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            counts = np.bincount(assignment, minlength=len(centroids))
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        return centroids
+
+    def _nearest_centroids(self, queries, count):
+        distances = _squared_distances(queries, self.centroids)
+        count = min(count, len(self.centroids))
+        return np.argpartition(distances, count - 1, axis=1)[:, :count]
+
+    def search(self, queries):
+        """Returns the nearest (username, distance) for each query encoding,
+        (None, inf) when nobody is enrolled."""
+        self.refresh()
+        queries = np.atleast_2d(np.asarray(queries, np.float32))
+        if not len(self.vectors):
+            return [(None, float('inf'))] * len(queries)
+        if self.centroids is None:
+            distances = _squared_distances(queries, self.vectors, self.norms)
+            rows = distances.argmin(axis=1)
+            best = distances[np.arange(len(queries)), rows]
+        else:
+            rows, best = [], []
+            for query, probes in zip(queries, self._nearest_centroids(queries, self.nprobe)):
+                candidates = np.concatenate([self.lists[p] for p in probes])
+                if not len(candidates):
+                    candidates = np.arange(len(self.vectors))
+                distances = _squared_distances(query[None], self.vectors[candidates], self.norms[candidates])[0]
+                idx = distances.argmin()
+                rows.append(candidates[idx])
+                best.append(distances[idx])
+        return [(self.usernames[self.owners[row]], float(np.sqrt(max(d, 0.0)))) for row, d in zip(rows, best)]
+
+    def impostors(self, queries, username, tolerance):
+        """Faces whose nearest enrolled user within tolerance is not `username`,
+        as (query index, matched username, distance)."""
+        return [(idx, match, distance) for idx, (match, distance) in enumerate(self.search(queries))
+                if match is not None and match != username and distance <= tolerance]
+
+
+def _squared_distances(queries, vectors, norms=None):
+    if norms is None:
+        norms = np.einsum('ij,ij->i', vectors, vectors)
+    return np.einsum('ij,ij->i', queries, queries)[:, None] + norms[None, :] - 2 * queries @ vectors.T
+
+
+identity = IdentityIndex(encodings.packed, app.config['IDENTITY_PARTITIONS'], app.config['IDENTITY_NPROBE'])
@@ -0,0 +1,201 @@
+import os, queue, time
+from collections import deque
+import cv2
+import numpy as np
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+
+class BatchDetector(object):
+    """
+    Runs the SSD on several frames in a single forward pass. Frames from
+    different sessions are packed into one blob and the detections, which
+    the SSD tags with the index of their image, are split back per frame
+    in the (classIds, confs, bbox) layout of cv2.dnn_DetectionModel.detect.
+    """
+
+    def __init__(self, net, size=(320, 320), scale=1.0/127.5, mean=(127.5, 127.5, 127.5), swap_rb=True):
+        self.net = net
+        self.size = size
+        self.scale = scale
+        self.mean = mean
+        self.swap_rb = swap_rb
+
+    def detect(self, frames, conf_threshold=0.5):
+        blob = cv2.dnn.blobFromImages(frames, self.scale, self.size, self.mean, swapRB=self.swap_rb, crop=False)
+        self.net.setInput(blob)
+        # rows of [image_id, class_id, confidence, left, top, right, bottom]
+        detections = self.net.forward().reshape(-1, 7)
+        detections = detections[detections[:, 2] >= conf_threshold]
+
+        results = []
+        for idx, frame in enumerate(frames):
+            rows = detections[detections[:, 0] == idx]
+            height, width = frame.shape[:2]
+            left = np.clip(rows[:, 3] * width, 0, width - 1)
+            top = np.clip(rows[:, 4] * height, 0, height - 1)
+            right = np.clip(rows[:, 5] * width, 0, width - 1)
+            bottom = np.clip(rows[:, 6] * height, 0, height - 1)
+            bbox = np.stack([left, top, right - left + 1, bottom - top + 1], axis=1).astype(np.int32)
+            classIds = rows[:, 1].astype(np.int32).reshape(-1, 1)
+            confs = rows[:, 2].astype(np.float32).reshape(-1, 1)
+            results.append((classIds, confs, bbox))
+        return results
+
+
+class OnnxDetector(object):
+    """
+    Runs an SSD exported with the TensorFlow object detection API to ONNX
+    (tf2onnx) on ONNX Runtime's CPU provider. Such models take uint8 RGB
+    images, NHWC, and return normalised [ymin, xmin, ymax, xmax] boxes with
+    their scores and 1-based COCO class ids, the ids coco.names is indexed
+    by. INT8 models quantised with onnxruntime.quantization load the same
+    way. Results use the layout of BatchDetector.detect.
+    """
+
+    def __init__(self, path, size=(320, 320), threads=1):
+        if onnxruntime is None:
+            raise RuntimeError('the onnxruntime detector backend needs the onnxruntime package')
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input = model_input.name
+        # static input shapes win over the configured size
+        height, width = model_input.shape[1:3]
+        self.size = (width, height) if isinstance(width, int) and isinstance(height, int) else size
+        self.batched = not isinstance(model_input.shape[0], int) or model_input.shape[0] > 1
+        names = [output.name for output in self.session.get_outputs()]
+        self.outputs = [next(n for n in names if key in n) for key in ('boxes', 'scores', 'classes')]
+
+    def detect(self, frames, conf_threshold=0.5):
+        images = np.stack([cv2.cvtColor(cv2.resize(frame, self.size), cv2.COLOR_BGR2RGB) for frame in frames])
+        if self.batched:
+            boxes, scores, classes = self.session.run(self.outputs, {self.input: images})
+        else:
+            runs = [self.session.run(self.outputs, {self.input: image[None]}) for image in images]
+            boxes, scores, classes = (np.concatenate(parts) for parts in zip(*runs))
+
+        results = []
+        for frame, rows, confs, ids in zip(frames, boxes, scores, classes):
+            keep = confs >= conf_threshold
+            rows, confs, ids = rows[keep], confs[keep], ids[keep]
+            height, width = frame.shape[:2]
+            top = np.clip(rows[:, 0] * height, 0, height - 1)
+            left = np.clip(rows[:, 1] * width, 0, width - 1)
+            bottom = np.clip(rows[:, 2] * height, 0, height - 1)
+            right = np.clip(rows[:, 3] * width, 0, width - 1)
+            bbox = np.stack([left, top, right - left + 1, bottom - top + 1], axis=1).astype(np.int32)
+            results.append((ids.astype(np.int32).reshape(-1, 1), confs.astype(np.float32).reshape(-1, 1), bbox))
+        return results
+
+
+def _opencv_detector(base, spec):
+    if spec.get('threads'):
+        cv2.setNumThreads(spec['threads'])
+    model = os.path.join(base, spec['model'])
+    if model.endswith('.onnx'):
+        net = cv2.dnn.readNetFromONNX(model)
+    else:
+        net = cv2.dnn.readNetFromTensorflow(model, os.path.join(base, spec['config']))
+    size = spec.get('size', 320)
+    return BatchDetector(net, (size, size))
+
+
+def _onnxruntime_detector(base, spec):
+    size = spec.get('size', 320)
+    return OnnxDetector(os.path.join(base, spec['model']), (size, size), spec.get('threads', 1))
+
+
+BACKENDS = {
+    'opencv': _opencv_detector,
+    'onnxruntime': _onnxruntime_detector,
+}
+
+
+def build_detector(base, spec):
+    """Builds the object detector described by a DETECTORS entry: its
+    `backend`, `model` file (and `config` for TensorFlow graphs) relative
+    to `base`, input `size` and `threads`."""
+    try:
+        backend = BACKENDS[spec['backend']]
+    except KeyError:
+        raise ValueError(f"unknown detector backend {spec.get('backend')!r}, expected one of {sorted(BACKENDS)}")
+    return backend(base, spec)
+
+
+def detector_files(base, spec):
+    return [os.path.join(base, spec[key]) for key in ('model', 'config') if key in spec]
+
+
+class BatchStats(object):
+    """Throughput against per-frame latency of a micro-batching consumer."""
+
+    def __init__(self, window=1000):
+        self.frames = 0
+        self.batches = 0
+        self.busy = 0.0
+        self.started = None
+        self.latencies = deque(maxlen=window)
+
+    def record(self, latencies, seconds):
+        if self.started is None:
+            self.started = time.perf_counter() - seconds
+        self.frames += len(latencies)
+        self.batches += 1
+        self.busy += seconds
+        self.latencies.extend(latencies)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0
+        latencies = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        return {
+            'frames': self.frames,
+            'batches': self.batches,
+            'mean_batch': self.frames / max(self.batches, 1),
+            'fps': self.frames / elapsed if elapsed else 0.0,
+            'inference_fps': self.frames / self.busy if self.busy else 0.0,
+            'latency_p50_ms': float(np.percentile(latencies, 50)),
+            'latency_p99_ms': float(np.percentile(latencies, 99)),
+        }
+
+
+class MicroBatcher(object):
+    """
+    Gathers work items into batches: blocks for the first item, then keeps
+    collecting until max_batch items are held or max_wait seconds have
+    passed since the first one arrived.
+    """
+
+    def __init__(self, max_batch, max_wait):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = BatchStats()
+
+    def collect(self, get, accept=None):
+        """
+        Arguments:
+            get: Callable taking a timeout (None blocks) and raising queue.Empty
+            accept: Optional callable, items it rejects are not batched
+        """
+        batch = []
+        deadline = None
+        while len(batch) < self.max_batch:
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+            try:
+                item = get(timeout=timeout)
+            except queue.Empty:
+                break
+            if accept is None or accept(item):
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.perf_counter() + self.max_wait
+        return batch
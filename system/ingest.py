@@ -0,0 +1,159 @@
+import struct, threading
+from collections import deque
+import cv2
+import numpy as np
+from system import app
+from system.metrics import metrics
+
+
+HEADER = struct.Struct('>I')
+
+
+class FrameBuffer(object):
+    """
+    Bounded ring buffer of decoded frames for one exam session. When the
+    analysis stage falls behind the oldest frames are overwritten, and
+    latest() skips to the newest frame, so it always works on the most
+    recent view of the student.
+    """
+
+    def __init__(self, size, activity=None):
+        self.frames = deque(maxlen=size)
+        self.received = 0
+        self.dropped = 0
+        self.closed = False
+        self.activity = activity
+        self._lock = threading.Lock()
+
+    def push(self, frame):
+        with self._lock:
+            if self.closed:
+                return False
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+            self.frames.append(frame)
+            self.received += 1
+        if self.activity is not None:
+            self.activity.set()
+        return True
+
+    def latest(self):
+        """Returns the newest frame, or None, and drops the older ones."""
+        with self._lock:
+            if not self.frames:
+                return None
+            frame = self.frames.pop()
+            self.dropped += len(self.frames)
+            self.frames.clear()
+            return frame
+
+    def release(self):
+        with self._lock:
+            self.closed = True
+            self.frames.clear()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def stats(self):
+        return {'received': self.received, 'dropped': self.dropped, 'depth': len(self.frames)}
+
+
+class FrameIngest(object):
+    """Per-session frame buffers keyed by (user_id, exam_id)."""
+
+    def __init__(self, size):
+        self.size = size
+        # set whenever any session receives a frame
+        self.activity = threading.Event()
+        # frames of the sessions already closed
+        self.received = 0
+        self.dropped = 0
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def open(self, key):
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None or buffer.closed:
+                buffer = self._buffers[key] = FrameBuffer(self.size, self.activity)
+            return buffer
+
+    def get(self, key):
+        return self._buffers.get(key)
+
+    def close(self, key):
+        with self._lock:
+            buffer = self._buffers.pop(key, None)
+            if buffer is not None:
+                self.received += buffer.received
+                self.dropped += buffer.dropped
+        if buffer is not None:
+            buffer.release()
+
+    def stats(self):
+        """Totals over all sessions, closed ones included."""
+        with self._lock:
+            buffers = list(self._buffers.values())
+            received, dropped = self.received, self.dropped
+        return {
+            'sessions': len(buffers),
+            'depth': sum(len(buffer) for buffer in buffers),
+            'received': received + sum(buffer.received for buffer in buffers),
+            'dropped': dropped + sum(buffer.dropped for buffer in buffers),
+        }
+
+    def sessions(self):
+        return list(self._buffers)
+
+
+def decode_frame(data):
+    """Decodes a JPEG or WebP payload into a BGR frame, None if invalid."""
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def read_chunks(stream, max_size):
+    """Yields the payloads of a stream of length-prefixed frames: a 4 byte
+    big-endian length followed by the encoded image."""
+    while True:
+        header = _read_exact(stream, HEADER.size)
+        if header is None:
+            return
+        size, = HEADER.unpack(header)
+        if size > max_size:
+            raise ValueError(f'Frame of {size} bytes exceeds {max_size}')
+        data = _read_exact(stream, size)
+        if data is None:
+            return
+        yield data
+
+
+def _read_exact(stream, size):
+    # chunked request bodies may hand back fewer bytes than asked for
+    parts = []
+    while size:
+        part = stream.read(size)
+        if not part:
+            return None
+        parts.append(part)
+        size -= len(part)
+    return b''.join(parts)
+
+
+def pack_chunk(data):
+    return HEADER.pack(len(data)) + data
+
+
+ingest = FrameIngest(app.config['INGEST_BUFFER_FRAMES'])
+
+
+@metrics.collector
+def _collect_ingest(metrics):
+    # totals over all sessions, a label per session would grow without bound
+    stats = ingest.stats()
+    metrics.set('ingest_sessions', stats['sessions'])
+    metrics.set('ingest_buffer_depth', stats['depth'])
+    metrics.total('ingest_frames_received_total', stats['received'])
+    metrics.total('ingest_frames_dropped_total', stats['dropped'])
@@ -0,0 +1,178 @@
+import bisect, json, os, threading, time
+
+
+# seconds, from a fast NumPy step to a slow model load
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+
+
+class Histogram(object):
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics(object):
+    """
+    Counters, gauges and histograms of one process, rendered in the
+    Prometheus text format. Recording is a dict lookup and a few integer
+    updates, cheap enough for every stage of every frame.
+
+    Collectors registered with `collector` are called when a snapshot is
+    taken, to sample gauges such as queue depths. Worker processes send
+    their snapshots to the web process, which merges them into its own
+    output under a `worker` label.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+        self._collectors = []
+        self._remote = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.gauges[self._key(name, labels)] = value
+
+    def total(self, name, value, **labels):
+        """Sets a counter that is kept elsewhere, such as in a buffer's stats."""
+        self.counters[self._key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        histogram.observe(seconds)
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def collector(self, fn):
+        """Registers fn(metrics), called before every snapshot."""
+        self._collectors.append(fn)
+        return fn
+
+    def snapshot(self):
+        """Plain data of every series, safe to pickle to another process."""
+        for fn in self._collectors:
+            try:
+                fn(self)
+            except Exception as e:
+                print(f'Metrics collector {fn.__name__} failed: {e}')
+        return {
+            'counters': list(self.counters.items()),
+            'gauges': list(self.gauges.items()),
+            'histograms': [(key, (h.buckets, list(h.counts), h.sum, h.count)) for key, h in list(self.histograms.items())],
+            'time': time.time(),
+        }
+
+    def merge(self, source, snapshot):
+        """Keeps the latest snapshot of another process."""
+        self._remote[source] = snapshot
+
+    def forget(self, source):
+        """Drops the snapshot of a process that has exited."""
+        self._remote.pop(source, None)
+
+    def render(self):
+        snapshots = [(None, self.snapshot())] + sorted(self._remote.items())
+        series = {}
+        for source, snapshot in snapshots:
+            extra = () if source is None else (('worker', source),)
+            for kind in ('counters', 'gauges', 'histograms'):
+                for (name, labels), value in snapshot[kind]:
+                    series.setdefault((name, kind), []).append((labels + extra, value))
+
+        kinds = {'counters': 'counter', 'gauges': 'gauge', 'histograms': 'histogram'}
+        lines = []
+        for (name, kind), values in sorted(series.items()):
+            if name in self.help:
+                lines.append(f'# HELP {name} {self.help[name]}')
+            lines.append(f'# TYPE {name} {kinds[kind]}')
+            for labels, value in values:
+                if kind != 'histograms':
+                    lines.append(f'{name}{_labels(labels)} {value}')
+                    continue
+                buckets, counts, total, count = value
+                cumulative = 0
+                for bound, n in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {total}')
+                lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels) + '}'
+
+
+class StageTimer(object):
+    """
+    Times the stages of a session's frames into the proctor_stage_seconds
+    histogram. Each lap() closes the stage that ran since the previous
+    one. The metrics are shared by all sessions; with a trace file, every
+    frame's stage durations are also appended to it as a JSON line.
+    """
+
+    def __init__(self, metrics, trace=None):
+        self.metrics = metrics
+        self.trace = open(trace, 'a', buffering=1 << 16) if trace else None
+        self.timings = {}
+        self._last = None
+
+    def start(self):
+        self.timings = {}
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.metrics.observe('proctor_stage_seconds', now - self._last, stage=stage)
+        self.timings[stage] = now - self._last
+        self._last = now
+
+    def finish(self):
+        self.metrics.inc('proctor_frames_total')
+        if self.trace is not None:
+            self.trace.write(json.dumps({'time': time.time(), **self.timings}) + '\n')
+
+    def close(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+
+def trace_path(directory, name, exam_id):
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f'{exam_id}_{name}.jsonl')
+
+
+metrics = Metrics()
+metrics.describe('proctor_stage_seconds', 'Time spent in each analysis stage of a frame.')
+metrics.describe('proctor_frames_total', 'Frames analysed.')
+metrics.describe('proctor_stage_runs_total', 'Frames an analysis stage ran on.')
+metrics.describe('proctor_stage_skips_total', 'Frames an analysis stage was skipped on by the rate controller.')
@@ -46,6 +46,10 @@ class Exam(db.Model):
     questions = db.Column(db.String(20), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    @property
+    def end_time(self):
+        return self.start_time + timedelta(minutes=self.duration)
+
 
 class UserExam(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -54,4 +58,44 @@ class UserExam(db.Model):
     attempted = db.Column(db.Boolean, default=False)
     attempted_file = db.Column(db.String(20), nullable=True)
     corrected = db.Column(db.Boolean, default=False)
-    marks = db.Column(db.Integer, nullable=False)
\ No newline at end of file
+    marks = db.Column(db.Integer, nullable=False)
+    response = db.relationship('Response', backref='attempt', lazy=True, uselist=False)
+
+
+class Response(db.Model):
+    # answer codes of an attempt packed one byte per question, in question order
+    id = db.Column(db.Integer, primary_key=True)
+    attempt_id = db.Column(db.Integer, db.ForeignKey('user_exam.id'), nullable=False, unique=True)
+    exam_id = db.Column(db.Integer, db.ForeignKey('exam.id'), nullable=False, index=True)
+    answers = db.Column(db.LargeBinary, nullable=False)
+
+
+class ProctorEvent(db.Model):
+    __table_args__ = (db.Index('ix_proctor_event_session', 'exam_id', 'user_id', 'timestamp'),)
+    id = db.Column(db.Integer, primary_key=True)
+    exam_id = db.Column(db.Integer, db.ForeignKey('exam.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    kind = db.Column(db.String(20), nullable=False)
+    confidence = db.Column(db.Float, nullable=True)
+    bbox = db.Column(db.String(40), nullable=True)
+    thumbnail = db.Column(db.String(80), nullable=True)
+
+
+class Question(db.Model):
+    __table_args__ = (db.UniqueConstraint('exam_id', 'position', name='uq_question_position'),)
+    id = db.Column(db.Integer, primary_key=True)
+    exam_id = db.Column(db.Integer, db.ForeignKey('exam.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    correct = db.Column(db.String(1), nullable=False)
+    options = db.relationship('Option', backref='question', lazy=True, order_by='Option.letter')
+
+
+class Option(db.Model):
+    __table_args__ = (db.UniqueConstraint('question_id', 'letter', name='uq_option_letter'),)
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    letter = db.Column(db.String(1), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    credit = db.Column(db.Float, nullable=True)
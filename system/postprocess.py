@@ -0,0 +1,62 @@
+import numpy as np
+
+
+def nms(boxes, scores, threshold):
+    """Greedy non-maximum suppression of (left, top, right, bottom) boxes.
+    Returns the indices kept, highest score first."""
+    order = np.argsort(scores)[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while len(order):
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        width = np.clip(np.minimum(boxes[best, 2], boxes[rest, 2]) - np.maximum(boxes[best, 0], boxes[rest, 0]), 0, None)
+        height = np.clip(np.minimum(boxes[best, 3], boxes[rest, 3]) - np.maximum(boxes[best, 1], boxes[rest, 1]), 0, None)
+        inter = width * height
+        overlap = inter / np.maximum(areas[best] + areas[rest] - inter, 1e-9)
+        order = rest[overlap <= threshold]
+    return np.array(keep, np.int64)
+
+
+class DetectionFilter(object):
+    """
+    Post-processing of the SSD output. Only classes of the watch-list are
+    kept, each above its own score threshold, before non-maximum
+    suppression runs per class. Everything stays in NumPy arrays.
+    """
+
+    def __init__(self, class_names, thresholds, nms_threshold=0.2):
+        """
+        Arguments:
+            class_names: Names of the 1-based class ids of the model
+            thresholds (dict): Minimum score of each watched class name
+            nms_threshold: Overlap above which the weaker of two boxes of a class is dropped
+        """
+        names = [name.lower() for name in class_names]
+        unknown = {name for name in thresholds if name.lower() not in names}
+        if unknown:
+            raise ValueError(f'unknown detection classes {sorted(unknown)}')
+        # score threshold per class id, unwatched ids can never pass
+        self.thresholds = np.full(len(names) + 1, np.inf, np.float32)
+        for name, threshold in thresholds.items():
+            self.thresholds[names.index(name.lower()) + 1] = threshold
+        self.min_threshold = float(min(thresholds.values())) if thresholds else 1.0
+        self.nms_threshold = nms_threshold
+
+    def apply(self, classIds, confs, bbox):
+        """Filters detections in the layout of BatchDetector.detect. Returns
+        (class ids (N,), scores (N,), (left, top, right, bottom) boxes (N, 4))."""
+        ids = np.asarray(classIds, np.int64).reshape(-1)
+        scores = np.asarray(confs, np.float32).reshape(-1)
+        boxes = np.asarray(bbox, np.float32).reshape(-1, 4)
+        valid = (ids > 0) & (ids < len(self.thresholds))
+        keep = np.flatnonzero(valid)
+        keep = keep[scores[keep] >= self.thresholds[ids[keep]]]
+        ids, scores = ids[keep], scores[keep]
+        boxes = np.hstack([boxes[keep, :2], boxes[keep, :2] + boxes[keep, 2:]])
+        if len(ids) > 1:
+            # shifting each class apart keeps NMS from suppressing across classes
+            offsets = (ids * (boxes.max() + 1))[:, None].astype(np.float32)
+            keep = nms(boxes + offsets, scores, self.nms_threshold)
+            ids, scores, boxes = ids[keep], scores[keep], boxes[keep]
+        return ids, scores, boxes
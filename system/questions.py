@@ -0,0 +1,246 @@
+import csv, os, random, threading
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from system import app, db
+from system.models import Question, Option
+from system.metrics import metrics
+
+
+OPTIONS = ('A', 'B', 'C', 'D')
+
+
+class BankQuestion(object):
+    """One question of a bank. `index` is its row in the uploaded CSV, the
+    header being row 0, and names its field in the exam form. `options`
+    are (letter, text) pairs."""
+    __slots__ = ('index', 'text', 'options')
+
+    def __init__(self, index, text, options):
+        object.__setattr__(self, 'index', index)
+        object.__setattr__(self, 'text', text)
+        object.__setattr__(self, 'options', tuple(options))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('questions are shared between requests and cannot be changed')
+
+
+class QuestionBank(object):
+    """The questions of an exam, with their correct options in `key`.
+    `credit` is a read-only (questions, 1 + options) array of the share
+    of a question's marks given for leaving it blank (column 0) and for
+    each option, NaN where the option is simply wrong."""
+    __slots__ = ('questions', 'key', 'credit')
+
+    def __init__(self, questions, key, credit=None):
+        object.__setattr__(self, 'questions', tuple(questions))
+        object.__setattr__(self, 'key', tuple(key))
+        if credit is None:
+            credit = key_credit(self.key)
+        credit.setflags(write=False)
+        object.__setattr__(self, 'credit', credit)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('question banks are shared between requests and cannot be changed')
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __iter__(self):
+        return iter(self.questions)
+
+
+def key_credit(key, partial=()):
+    """The credit array of a key, with (question, letter, share) overrides."""
+    credit = np.full((len(key), len(OPTIONS) + 1), np.nan)
+    credit[:, 0] = 0
+    credit[np.arange(len(key)), [OPTIONS.index(letter) + 1 for letter in key]] = 1
+    for question, letter, share in partial:
+        credit[question, OPTIONS.index(letter) + 1] = share
+    return credit
+
+
+def read_questions(f):
+    """Yields (index, text, options, correct) for each row of a CSV with a
+    Question,A,B,C,D,Correct header. Raises ValueError at the first
+    invalid row, malformed CSV included."""
+    reader = csv.reader(f)
+    try:
+        if next(reader, None) is None:
+            raise ValueError('the file is empty')
+        yield from _validate(reader)
+    except csv.Error as e:
+        raise ValueError(f'row {reader.line_num}: {e}')
+
+
+def _validate(reader):
+    for index, row in enumerate(reader, 1):
+        if not any(cell.strip() for cell in row):
+            continue
+        # spreadsheets often save trailing empty cells
+        while len(row) > 6 and not row[-1].strip():
+            row.pop()
+        if len(row) != 6:
+            raise ValueError(f'row {index + 1} has {len(row)} columns, expected Question,A,B,C,D,Correct')
+        if not row[0].strip():
+            raise ValueError(f'row {index + 1} has no question')
+        correct = row[5].strip().upper()
+        if correct not in OPTIONS:
+            raise ValueError(f'row {index + 1}: Correct is "{row[5]}", expected one of A, B, C or D')
+        yield index, row[0], tuple(zip(OPTIONS, row[1:5])), correct
+
+
+def import_questions(exam_id, f, batch_size=500, session=None):
+    """Adds the questions of a CSV to an exam, inserting batch_size rows at
+    a time in the current transaction of `session`, the request's by
+    default, and returns how many there were. Raises ValueError if the
+    file is invalid; the caller rolls back."""
+    session = session or db.session
+    count = 0
+    batch = []
+    for row in read_questions(f):
+        batch.append(row)
+        if len(batch) == batch_size:
+            _insert(session, exam_id, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        _insert(session, exam_id, batch)
+        count += len(batch)
+    if not count:
+        raise ValueError('the file has no questions')
+    return count
+
+
+def _insert(session, exam_id, batch):
+    session.execute(Question.__table__.insert(), [
+        {'exam_id': exam_id, 'position': index, 'text': text, 'correct': correct}
+        for index, text, _, correct in batch])
+    ids = dict(session.query(Question.position, Question.id)
+               .filter(Question.exam_id == exam_id,
+                       Question.position.between(batch[0][0], batch[-1][0])))
+    session.execute(Option.__table__.insert(), [
+        {'question_id': ids[index], 'letter': letter, 'text': text}
+        for index, _, options, _ in batch for letter, text in options])
+
+
+def load_questions(exam_id):
+    """Reads the bank of an exam from the question and option tables."""
+    rows = db.session.query(Question.id, Question.position, Question.text, Question.correct)\
+        .filter(Question.exam_id == exam_id)\
+        .order_by(Question.position)\
+        .all()
+    row = {question_id: i for i, (question_id, *_) in enumerate(rows)}
+    options, partial = {}, []
+    for question_id, letter, text, credit in db.session.query(Option.question_id, Option.letter, Option.text, Option.credit)\
+            .join(Question, Question.id == Option.question_id)\
+            .filter(Question.exam_id == exam_id)\
+            .order_by(Option.question_id, Option.letter):
+        options.setdefault(question_id, []).append((letter, text))
+        if credit is not None:
+            partial.append((row[question_id], letter, credit))
+    key = [correct for *_, correct in rows]
+    return QuestionBank([BankQuestion(position, text, options.get(question_id, ())) for question_id, position, text, _ in rows],
+                        key, key_credit(key, partial))
+
+
+def shuffle_questions(bank, seed):
+    """The questions of a bank, and the options of each, in an order of
+    their own for `seed`. Options keep their letters."""
+    rng = random.Random(seed)
+    questions = [BankQuestion(q.index, q.text, rng.sample(q.options, len(q.options))) for q in bank]
+    rng.shuffle(questions)
+    return questions
+
+
+class QuestionCache(object):
+    """
+    Question banks by exam id. A bank is read from the database once and
+    shared by every request of the exam until invalidate() is called
+    after its questions change; the least recently used banks are evicted
+    beyond `capacity`. Exams created before the question tables only have
+    their CSV in `root`, which is imported on first use. Banks are loaded
+    under a lock of their exam, so a slow import holds up only the
+    requests of that exam.
+    """
+
+    def __init__(self, root, capacity=64, batch_size=500):
+        self.root = root
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._loading = {}
+        # bumped by invalidate(), so a load that raced with it is not cached
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, exam):
+        with self._lock:
+            bank = self._cached(exam.id)
+            if bank is not None:
+                return bank
+            loading = self._loading.setdefault(exam.id, threading.Lock())
+        with loading:
+            with self._lock:
+                # loaded by another request while this one waited
+                bank = self._cached(exam.id)
+                if bank is not None:
+                    return bank
+                self.misses += 1
+                generation = self._generations.get(exam.id, 0)
+            bank = load_questions(exam.id)
+            if not bank and exam.questions:
+                bank = self._import(exam)
+            with self._lock:
+                if self._generations.get(exam.id, 0) == generation:
+                    self._cache[exam.id] = bank
+                    while len(self._cache) > self.capacity:
+                        self._cache.popitem(last=False)
+                self._loading.pop(exam.id, None)
+            return bank
+
+    def _cached(self, exam_id):
+        bank = self._cache.get(exam_id)
+        if bank is not None:
+            self._cache.move_to_end(exam_id)
+            self.hits += 1
+        return bank
+
+    def _import(self, exam):
+        path = os.path.join(self.root, exam.questions)
+        if not os.path.exists(path):
+            return QuestionBank((), ())
+        # a session of its own, so the import neither commits nor rolls back the request's changes
+        session = db.create_session({})()
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                count = import_questions(exam.id, f, self.batch_size, session)
+            session.commit()
+            print(f'Imported {count} questions of exam {exam.id} from {exam.questions}')
+        except IntegrityError:
+            # imported by another process in the meantime
+            session.rollback()
+        except ValueError as e:
+            session.rollback()
+            raise ValueError(f'Questions of exam {exam.id} could not be imported: {e}')
+        finally:
+            session.close()
+        return load_questions(exam.id)
+
+    def invalidate(self, exam_id):
+        with self._lock:
+            self._cache.pop(exam_id, None)
+            self._generations[exam_id] = self._generations.get(exam_id, 0) + 1
+
+
+question_banks = QuestionCache(app.config['UPLOAD_FOLDER'], app.config['QUESTION_CACHE_SIZE'],
+                               app.config['QUESTION_IMPORT_BATCH'])
+
+
+@metrics.collector
+def _collect_questions(metrics):
+    metrics.set('question_banks_cached', len(question_banks._cache))
+    metrics.total('question_bank_hits_total', question_banks.hits)
+    metrics.total('question_bank_misses_total', question_banks.misses)
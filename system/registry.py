@@ -0,0 +1,143 @@
+import os, threading, time
+from contextlib import nullcontext
+import cv2, dlib
+from system import app
+from system.inference import build_detector, detector_files
+from system.metrics import metrics
+
+
+BASE = os.path.join(app.root_path, 'static', 'models')
+GAZE_MODELS = os.path.join(app.root_path, 'gaze_tracking', 'trained_models')
+# what each kind of process uses: proctor workers analyse frames, the web process verifies faces
+WORKER_MODELS = ('class_names', 'ssd_batch', 'face_detector', 'shape_predictor')
+WEB_MODELS = ('haar_face',)
+
+
+class ModelRegistry(object):
+    """
+    Loads every model used by the system at most once per worker process.
+    Models are built lazily on first use; `warm_up` can be called at
+    start-up to move the loading cost out of the first exam attempt.
+    """
+
+    def __init__(self, base=BASE):
+        self.base = base
+        self._models = {}
+        self._load_times = {}
+        self._load_memory = {}
+        self._lock = threading.Lock()
+        # OpenCV models keep per-call state and must not run concurrently
+        self._inference_locks = {'ssd_batch': threading.Lock(), 'haar_face': threading.Lock()}
+        self._loaders = {
+            'class_names': self._load_class_names,
+            'ssd_batch': self._load_ssd_batch,
+            'face_detector': self._load_face_detector,
+            'shape_predictor': self._load_shape_predictor,
+            'haar_face': self._load_haar_face,
+        }
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            # another thread may have finished loading while we waited
+            model = self._models.get(name)
+            if model is None:
+                start, rss = time.perf_counter(), _rss()
+                model = self._loaders[name]()
+                self._load_times[name] = time.perf_counter() - start
+                self._load_memory[name] = max(_rss() - rss, 0)
+                self._models[name] = model
+        return model
+
+    @property
+    def class_names(self):
+        return self.get('class_names')
+
+    @property
+    def ssd_batch(self):
+        return self.get('ssd_batch')
+
+    @property
+    def face_detector(self):
+        return self.get('face_detector')
+
+    @property
+    def shape_predictor(self):
+        return self.get('shape_predictor')
+
+    @property
+    def haar_face(self):
+        return self.get('haar_face')
+
+    def lock(self, name):
+        return self._inference_locks.get(name) or nullcontext()
+
+    def warm_up(self, names=None):
+        for name in names or self._loaders:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f'Could not load model {name}: {e}')
+        return dict(self._load_times)
+
+    def loaded(self):
+        return sorted(self._models)
+
+    def load_times(self):
+        return dict(self._load_times)
+
+    def memory_usage(self):
+        """Bytes attributed to each loaded model: the resident memory growth
+        measured while loading it, or the size of its files when the
+        platform does not expose resident memory."""
+        usage = {}
+        for name in self._models:
+            usage[name] = self._load_memory.get(name) or \
+                sum(os.path.getsize(p) for p in self._files(name) if os.path.exists(p))
+        return usage
+
+    def _files(self, name):
+        return {
+            'class_names': [os.path.join(self.base, 'coco.names')],
+            'ssd_batch': detector_files(self.base, app.config['DETECTORS'][app.config['DETECTOR']]),
+            'face_detector': [],
+            'shape_predictor': [os.path.join(GAZE_MODELS, 'shape_predictor_68_face_landmarks.dat')],
+            'haar_face': [os.path.join(self.base, 'haarcascade_frontalface_alt2.xml')],
+        }[name]
+
+    def _load_class_names(self):
+        with open(os.path.join(self.base, 'coco.names'), 'rt') as f:
+            return tuple(f.read().rstrip('\n').split('\n'))
+
+    def _load_ssd_batch(self):
+        return build_detector(self.base, app.config['DETECTORS'][app.config['DETECTOR']])
+
+    def _load_face_detector(self):
+        return dlib.get_frontal_face_detector()
+
+    def _load_shape_predictor(self):
+        return dlib.shape_predictor(self._files('shape_predictor')[0])
+
+    def _load_haar_face(self):
+        return cv2.CascadeClassifier(self._files('haar_face')[0])
+
+
+def _rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+models = ModelRegistry()
+
+
+@metrics.collector
+def _collect_models(metrics):
+    for name, seconds in models.load_times().items():
+        metrics.set('model_load_seconds', seconds, model=name)
+    for name, size in models.memory_usage().items():
+        metrics.set('model_memory_bytes', size, model=name)
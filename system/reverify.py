@@ -0,0 +1,110 @@
+import time
+import cv2, face_recognition
+import numpy as np
+from system import app
+from system.models import User
+from system.encodings import encodings, face_distances
+from system.identity import identity
+from system.events import bus
+
+
+def encoding_file_for(user_id):
+    """The user's encoding file, None for unknown or unenrolled users."""
+    with app.app_context():
+        user = User.query.get(user_id)
+        return user.encoding_file if user is not None else None
+
+
+class Verdict(object):
+    __slots__ = ('kind', 'distance', 'checked')
+
+    def __init__(self):
+        self.kind = None
+        self.distance = None
+        self.checked = None
+
+
+class IdentityMonitor(object):
+    """
+    Re-verifies the identity of the student during the exam, reusing the
+    face boxes of the proctoring face detector.
+
+    Faces are followed from one detection to the next by the proctor's
+    face tracker. A face keeps its verdict while its track lives, and is
+    only encoded again when it is new or its verdict is older than
+    `max_age` seconds. Encodings are computed at most once per `interval`
+    seconds per session, for all the faces then waiting, in one call.
+    """
+
+    def __init__(self, user_id, exam_id, encoding_file, interval=5.0, max_age=60.0,
+                 tolerance=0.3, clock=time.monotonic):
+        self.user_id = user_id
+        self.exam_id = exam_id
+        self.encoding_file = encoding_file
+        self.interval = interval
+        self.max_age = max_age
+        self.tolerance = tolerance
+        self.clock = clock
+        self.verdicts = {}
+        self.encoded = 0
+        self.reused = 0
+        self._last = None
+
+    def update(self, frame, tracks):
+        """Takes the face tracks (tracking.Track) of this frame and, when the
+        budget allows, verifies the faces without a current verdict."""
+        now = self.clock()
+        self.verdicts = {track.id: self.verdicts.get(track.id) or Verdict() for track in tracks}
+        stale = [track for track in tracks if self.verdicts[track.id].checked is None
+                 or now - self.verdicts[track.id].checked > self.max_age]
+        self.reused += len(tracks) - len(stale)
+        if stale and self.encoding_file and (self._last is None or now - self._last >= self.interval):
+            self._last = now
+            self._verify(frame, stale, now)
+
+    def _verify(self, frame, tracks, now):
+        references = encodings.get(self.encoding_file)
+        if references is None:
+            return
+        height, width = frame.shape[:2]
+        locations = []
+        for track in tracks:
+            left, top, right, bottom = (int(round(v)) for v in track.box)
+            locations.append((max(top, 0), min(right, width), min(bottom, height), max(left, 0)))
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        found = np.array(face_recognition.face_encodings(rgb, locations))
+        self.encoded += len(found)
+        if not len(found):
+            return
+
+        distances = face_distances(found, references).min(axis=1)
+        impostors = {idx: (username, distance) for idx, username, distance in
+                     identity.impostors(found, encodings.key(self.encoding_file), self.tolerance)}
+        for idx, (track, distance) in enumerate(zip(tracks, distances)):
+            verdict = self.verdicts[track.id]
+            previous = verdict.kind
+            if distance <= self.tolerance:
+                verdict.kind, verdict.distance = 'verified', float(distance)
+            elif idx in impostors:
+                verdict.kind, verdict.distance = 'impersonation', impostors[idx][1]
+            else:
+                verdict.kind, verdict.distance = 'identity mismatch', float(distance)
+            verdict.checked = now
+            # one event per track and verdict, not per check
+            if verdict.kind != 'verified' and verdict.kind != previous:
+                if verdict.kind == 'impersonation':
+                    print(f'User {self.user_id} shows the face of {impostors[idx][0]} ({verdict.distance:.2f})')
+                bus.publish(self.exam_id, self.user_id, verdict.kind,
+                            max(0.0, 1 - verdict.distance), track.xywh())
+
+    def verdict(self):
+        """'verified', 'identity mismatch' or 'impersonation' for the faces
+        in view, the worst one wins. None until a face has been checked."""
+        verdicts = {verdict.kind for verdict in self.verdicts.values() if verdict.kind}
+        for verdict in ('impersonation', 'identity mismatch', 'verified'):
+            if verdict in verdicts:
+                return verdict
+        return None
+
+    def stats(self):
+        return {'encoded': self.encoded, 'reused': self.reused}
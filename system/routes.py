@@ -1,4 +1,4 @@
-import os, secrets, threading, multiprocessing
+import os, secrets
 from datetime import datetime, timedelta
 from flask import (render_template, 
                     url_for, 
@@ -6,7 +6,10 @@ from flask import (render_template,
                     redirect, 
                     request, 
                     abort, 
-                    send_file)
+                    send_file,
+                    jsonify,
+                    Response,
+                    stream_with_context)
 from flask_login import (login_user, 
                         current_user, 
                         logout_user, 
@@ -25,17 +28,32 @@ from system.forms import (RegistrationForm,
                             ResetPasswordForm)
 from system.models import (User, 
                             Exam, 
-                            UserExam)
-from system.detection import detect_cheating
+                            UserExam,
+                            Response as AttemptResponse)
+from system.scheduler import scheduler
+from system.events import session_events
+from system.dashboard import hub
+from system.metrics import metrics
+from system.questions import (question_banks,
+                                import_questions,
+                                shuffle_questions,
+                                OPTIONS)
+from system.grading import (AnswerKey,
+                            encode_answers,
+                            decode_answers,
+                            attempt_answers,
+                            answer_counts,
+                            partial_credit,
+                            CODES,
+                            update_key)
+from system.ingest import (ingest,
+                            decode_frame,
+                            read_chunks)
 from system.utils import (send_reset_email, 
                             save_picture, 
                             allowed_file, 
-                            get_questions, 
                             image_to_encoding, 
-                            verify_face,
-                            get_result,
-                            store_responses,
-                            parse_answers)
+                            verify_face)
 
 
 @app.route("/")
@@ -141,7 +159,8 @@ def create_exam():
                 flash('Cannot create exam in the past', 'danger')
             else:
                 if allowed_file(filename):
-                    file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+                    path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+                    file.save(path)
                     exam = Exam(
                         topic=form.topic.data,
                         start_time=form.start.data,
@@ -152,10 +171,19 @@ def create_exam():
                         user_id=current_user.id
                     )
                     db.session.add(exam)
-                    db.session.commit()
-                    flash('Exam created successfully', 'success')
-                    os.mkdir(os.path.join(app.root_path, 'static', 'logs', str(exam.id)))
-                    return redirect(url_for('home'))
+                    try:
+                        db.session.flush()
+                        with open(path, newline='', encoding='utf-8-sig') as f:
+                            import_questions(exam.id, f, app.config['QUESTION_IMPORT_BATCH'])
+                        db.session.commit()
+                    except ValueError as e:
+                        db.session.rollback()
+                        os.remove(path)
+                        flash(f'Invalid question file: {e}', 'danger')
+                    else:
+                        flash('Exam created successfully', 'success')
+                        os.mkdir(os.path.join(app.root_path, 'static', 'logs', str(exam.id)))
+                        return redirect(url_for('home'))
                 else:
                     flash('Invalid file', 'danger')
         return render_template('create_exam.html', title='Create Exam', form=form)
@@ -192,7 +220,7 @@ def join_exam(exam_id):
                     if exam.start_time + timedelta(minutes=exam.duration) < datetime.now():
                         flash('Exam completed', 'danger')
                     else:
-                        if current_user and verify_face(current_user.encoding_file, request.form['face_img']):
+                        if current_user and verify_face(current_user.encoding_file, request.form['face_img'], exam.id):
                             return redirect(url_for('attempt_exam', exam_id=exam.id))
                         else:
                             flash('Joining Unsuccessful. Face not recognized.', 'danger')
@@ -211,23 +239,23 @@ def join_exam(exam_id):
 def attempt_exam(exam_id):
     exam = Exam.query.filter_by(id=exam_id).first()
     form = SubmitExamForm()
-    test = get_questions(exam.questions)
+    bank = question_banks.get(exam)
     responses = []
-    x = threading.Thread(target=detect_cheating, args=[current_user.id, exam], daemon=True)
-    x.start()
     if request.method == 'POST':
         row = UserExam.query.filter_by(user_id=current_user.id, exam_id=exam_id).first()
         if row:
             flash('Exam already attempted', 'danger')
             return redirect(url_for('home'))
         else:
-            if x.is_alive():
-                for question in test:
-                    responses.append(request.form.get(str(question[6])))
-                path = store_responses(str(current_user.id)+str(exam.id), responses)
-                score = get_result(responses, test, exam.marks)
-                row = UserExam(user_id=current_user.id, exam_id=exam_id, attempted=True, attempted_file=path, marks=score)
+            scheduler.stop(current_user.id, exam.id)
+            if datetime.now() <= exam.end_time + timedelta(seconds=app.config['SUBMISSION_GRACE_SECONDS']):
+                for question in bank:
+                    responses.append(request.form.get(str(question.index)))
+                answers = encode_answers(responses)
+                score = float(AnswerKey.for_exam(exam, bank).grade(answers)[0])
+                row = UserExam(user_id=current_user.id, exam_id=exam_id, attempted=True, marks=score)
                 db.session.add(row)
+                db.session.add(AttemptResponse(attempt=row, exam_id=exam_id, answers=answers.tobytes()))
                 db.session.commit()
                 flash(f'Exam submitted!', 'success')
                 return redirect(url_for('home'))
@@ -235,7 +263,48 @@ def attempt_exam(exam_id):
                 flash(f'Exam was submitted late!', 'danger')
                 return redirect(url_for('home'))
     else:
-        return render_template('exam.html', title=f'{exam.topic} Exam', test=test, form=form, time=exam.duration*60000, timeleft=exam.duration*30000, exam_id=exam_id)
+        # refreshing the page after submitting must not proctor the student again
+        if UserExam.query.filter_by(user_id=current_user.id, exam_id=exam_id).first():
+            flash('Exam already attempted', 'danger')
+            return redirect(url_for('home'))
+        # a student who joins late has until the end of the exam, not its full duration
+        remaining = min(exam.duration * 60, (exam.end_time - datetime.now()).total_seconds())
+        if remaining <= 0:
+            flash('Exam completed', 'danger')
+            return redirect(url_for('home'))
+        if not scheduler.start(current_user.id, exam.id, remaining / 60):
+            flash('Proctoring is at capacity. Please try joining again in a few minutes.', 'danger')
+            return redirect(url_for('join_exam', exam_id=exam_id))
+        test = bank.questions
+        if app.config['QUESTION_SHUFFLE']:
+            test = shuffle_questions(bank, f'{exam.id}:{current_user.id}')
+        return render_template('exam.html', title=f'{exam.topic} Exam', test=test, form=form, time=int(remaining*1000), timeleft=int(remaining*500), exam_id=exam_id)
+
+
+@app.route("/ingest/<int:exam_id>", methods=['POST'])
+@login_required
+def ingest_frames(exam_id):
+    buffer = ingest.get((current_user.id, exam_id))
+    if buffer is None:
+        abort(409)
+    max_size = app.config['INGEST_MAX_FRAME_BYTES']
+    if request.mimetype in ('image/jpeg', 'image/webp'):
+        if (request.content_length or 0) > max_size:
+            abort(413)
+        chunks = [request.get_data()]
+    else:
+        chunks = read_chunks(request.stream, max_size)
+    accepted, invalid = 0, 0
+    try:
+        for data in chunks:
+            frame = decode_frame(data)
+            if frame is None:
+                invalid += 1
+            elif buffer.push(frame):
+                accepted += 1
+    except ValueError:
+        abort(413)
+    return jsonify(accepted=accepted, invalid=invalid, **buffer.stats())
 
 
 @app.route("/result")
@@ -268,13 +337,16 @@ def correction(exam_id):
 def correct(exam_id):
     details = UserExam.query.filter_by(id=exam_id).first()
     exam = Exam.query.filter_by(id=details.exam_id).first()
-    questions = get_questions(exam.questions)
-    answers = parse_answers(details.attempted_file)
+    bank = question_banks.get(exam)
+    codes = attempt_answers(details, len(bank))
+    answers = decode_answers(codes)
+    key = AnswerKey.for_exam(exam, bank)
+    marks = key.question_marks(codes)[0]
     form = SubmitExamForm()
     score = 0
     if request.method == 'POST':
         for i in range(len(answers)):
-            score += int(request.form.get(str(questions[i][6])))
+            score += float(request.form.get(str(bank.questions[i].index)))
         print(score)
         details.marks = score
         details.corrected = True
@@ -282,33 +354,82 @@ def correct(exam_id):
         db.session.commit()
         flash('Marks updated!', 'success')
         return redirect(url_for('correction', exam_id=exam.id))
-    path = os.path.join(app.root_path, 'static', 'logs', str(details.exam_id), str(details.user_id))
-    images = []
-    for img in os.listdir(path):
-        images.append(os.path.join('..', 'static', 'logs', str(details.exam_id), str(details.user_id), img))
-    print(images)
-    return render_template('correct.html', details=details, n=len(answers), max_marks=exam.marks//len(answers), questions=questions, answers=answers, form=form, images=images)
-
-
-"""
-def gen(camera):
-    while True:
-        frame, persons = camera.get_frame()
-        if persons > 1:
-            print(f'{persons} people detected.')
-            # with app.app_context():
-            #     flash('2 people detected.')
-        # else:
-        #     print('1 person detected.')
-        if frame is not None:
-            yield(b'--frame\r\n'
-                b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n\r\n')
-
-
-@app.route('/video_feed')
-def video_feed():
-    return Response(gen(VideoCamera()), mimetype='multipart/x-mixed-replace; boundary=frame')
-"""
+    events = session_events(details.exam_id, details.user_id)
+    images = [url_for('static', filename=event.thumbnail) for event in events if event.thumbnail]
+    return render_template('correct.html', details=details, n=len(answers), max_marks=key.per_question, min_marks=key.marks.min(initial=0), marks=marks, questions=bank.questions, key=bank.key, answers=answers, form=form, images=images, events=events)
+
+
+@app.route("/answer_key/<int:exam_id>", methods=['GET', 'POST'])
+@login_required
+def answer_key(exam_id):
+    if not current_user.user_access:
+        abort(403)
+    exam = Exam.query.get_or_404(exam_id)
+    bank = question_banks.get(exam)
+    form = SubmitExamForm()
+    if request.method == 'POST':
+        correct, credit = {}, {}
+        try:
+            for question in bank:
+                if request.form.get(f'correct-{question.index}') in OPTIONS:
+                    correct[question.index] = request.form[f'correct-{question.index}']
+                for letter, _ in question.options:
+                    value = request.form.get(f'credit-{question.index}-{letter}', '').strip()
+                    credit[(question.index, letter)] = float(value) / 100 if value else None
+        except ValueError:
+            flash('Credit must be a percentage', 'danger')
+        else:
+            questions, regraded = update_key(exam, correct, credit)
+            db.session.commit()
+            question_banks.invalidate(exam.id)
+            flash(f'Answer key of {questions} questions changed, {regraded} attempts regraded', 'success')
+            return redirect(url_for('answer_key', exam_id=exam.id))
+    partial = {option: round(share * 100, 2) for option, share in partial_credit(exam.id).items()}
+    counts = answer_counts(exam.id, len(bank))
+    return render_template('answer_key.html', title=f'{exam.topic} Answer Key', exam=exam, questions=bank.questions, key=bank.key, partial=partial, counts=counts, codes=CODES, form=form)
+
+
+@app.route("/dashboard/<int:exam_id>")
+@login_required
+def dashboard(exam_id):
+    if not current_user.user_access:
+        abort(403)
+    exam = Exam.query.get_or_404(exam_id)
+    return render_template('dashboard.html', title=f'{exam.topic} Live', exam=exam)
+
+
+@app.route("/dashboard/<int:exam_id>/events")
+@login_required
+def dashboard_events(exam_id):
+    if not current_user.user_access:
+        abort(403)
+    response = Response(stream_with_context(hub.stream(exam_id)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route("/dashboard/<int:exam_id>/thumbnail/<int:user_id>")
+@login_required
+def dashboard_thumbnail(exam_id, user_id):
+    if not current_user.user_access:
+        abort(403)
+    thumbnail = hub.thumbnail(user_id, exam_id)
+    if thumbnail is None:
+        abort(404)
+    response = Response(thumbnail, mimetype='image/jpeg')
+    # the page asks for each version once, by its ?v= query
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+@app.route("/metrics")
+@login_required
+def metrics_endpoint():
+    # the series name workers and exams, so only teachers may read them
+    if not current_user.user_access:
+        abort(403)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route("/reset_password", methods=['GET', 'POST'])
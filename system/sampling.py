@@ -0,0 +1,76 @@
+import time
+import cv2
+import numpy as np
+
+
+class AnalysisRateController(object):
+    """
+    Decides which analysis stages run on each frame of a session.
+
+    Every stage has a cadence: it runs on every Nth frame. A cheap motion
+    gate compares a 32x24 thumbnail of the frame with the previous one,
+    and while the scene is static every stage drops to `static_every`.
+    A suspicious event switches all stages to every frame for
+    `escalation` seconds.
+    """
+
+    THUMBNAIL = (32, 24)
+
+    def __init__(self, cadence, motion_threshold=3.0, static_every=10, escalation=10.0, clock=time.monotonic):
+        self.cadence = dict(cadence)
+        self.motion_threshold = motion_threshold
+        self.static_every = static_every
+        self.escalation = escalation
+        self.clock = clock
+        self.frames = 0
+        self.static_frames = 0
+        self.escalated_until = 0.0
+        self.runs = dict.fromkeys(self.cadence, 0)
+        self.skips = dict.fromkeys(self.cadence, 0)
+        self._previous = None
+
+    def motion(self, frame):
+        """Mean absolute difference of the frame's thumbnail with the last one."""
+        thumbnail = cv2.resize(frame, self.THUMBNAIL, interpolation=cv2.INTER_AREA)
+        if thumbnail.ndim == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        thumbnail = thumbnail.astype(np.int16)
+        previous, self._previous = self._previous, thumbnail
+        if previous is None:
+            return float('inf')
+        return float(np.mean(np.abs(thumbnail - previous)))
+
+    def plan(self, frame):
+        """Returns the set of stages to run on this frame."""
+        frame_no = self.frames
+        self.frames += 1
+        static = self.motion(frame) < self.motion_threshold
+        if static:
+            self.static_frames += 1
+
+        stages = set()
+        for stage, every in self.cadence.items():
+            if self.escalated():
+                every = 1
+            elif static:
+                every = max(every, self.static_every)
+            if frame_no % every == 0:
+                stages.add(stage)
+                self.runs[stage] += 1
+            else:
+                self.skips[stage] += 1
+        return stages
+
+    def escalate(self):
+        self.escalated_until = self.clock() + self.escalation
+
+    def escalated(self):
+        return self.clock() < self.escalated_until
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'static_frames': self.static_frames,
+            'runs': dict(self.runs),
+            'skips': dict(self.skips),
+        }
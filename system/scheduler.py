@@ -0,0 +1,328 @@
+import multiprocessing, threading, time, traceback
+from system import app
+from system.ingest import ingest
+from system.inference import MicroBatcher
+from system.dashboard import hub
+from system.metrics import metrics
+
+
+class Session(object):
+    __slots__ = ('key', 'worker', 'deadline', 'expired')
+
+    def __init__(self, key, worker, deadline):
+        self.key = key
+        self.worker = worker
+        self.deadline = deadline
+        self.expired = False
+
+
+class ProctorScheduler(object):
+    """
+    Spreads proctoring sessions over a fixed pool of worker processes.
+
+    Each (user_id, exam_id) pair owns at most one session, pinned to the
+    least loaded worker. A dispatcher thread moves the newest frame of
+    every session from its ingest buffer to the session's worker. Each
+    worker accepts a bounded number of frames in flight; while it is full
+    its sessions' frames stay in their ring buffers, where the oldest are
+    overwritten, so a slow worker sheds load instead of queueing it.
+    Workers run the SSD on micro-batches of frames across their sessions.
+    A worker that dies is respawned, at most every `respawn_delay`
+    seconds, and its sessions are started again on the new process; new
+    sessions only go to live workers.
+    """
+
+    respawn_delay = 10.0
+
+    def __init__(self, workers, sessions_per_worker, frames_in_flight, max_batch, max_wait):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_sessions = workers * sessions_per_worker
+        self.frames_in_flight = frames_in_flight
+        self.sessions = {}
+        self.rejected = 0
+        self.backpressured = 0
+        self.respawned = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _start_pool(self):
+        # spawn keeps OpenCV/dlib thread pools of the web process out of the workers
+        self._context = multiprocessing.get_context('spawn')
+        # status, alerts and thumbnails of every session, from all workers
+        self.results = self._context.Queue()
+        self._pool = [self._spawn(Worker()) for _ in range(self.workers)]
+        threading.Thread(target=self._dispatch, daemon=True).start()
+        threading.Thread(target=self._collect, daemon=True).start()
+
+    def _spawn(self, worker):
+        # a fresh inbox and slots: a dead process never releases the slots it held
+        worker.inbox = self._context.Queue()
+        worker.slots = self._context.BoundedSemaphore(self.frames_in_flight)
+        worker.process = self._context.Process(target=_worker, args=(worker.inbox, worker.slots, self.results, self.max_batch, self.max_wait), daemon=True)
+        worker.process.start()
+        worker.started = time.time()
+        return worker
+
+    def _respawn(self, worker):
+        print(f'Proctor worker {worker.process.name} exited with code {worker.process.exitcode}, restarting')
+        metrics.forget(worker.process.name)
+        self._spawn(worker)
+        self.respawned += 1
+        for session in self.sessions.values():
+            if session.worker is worker and not session.expired:
+                worker.inbox.put(('start', session.key, None, None))
+
+    def start(self, user_id, exam_id, duration):
+        """Starts proctoring unless it is already running. Returns False
+        when every worker is at capacity."""
+        key = (user_id, exam_id)
+        with self._lock:
+            if key in self.sessions:
+                return True
+            if sum(w.sessions for w in self._pool or []) >= self.max_sessions:
+                self.rejected += 1
+                return False
+            if self._pool is None:
+                self._start_pool()
+            alive = [w for w in self._pool if w.process.is_alive()]
+            if not alive:
+                self.rejected += 1
+                return False
+            worker = min(alive, key=lambda w: w.sessions)
+            worker.sessions += 1
+            self.sessions[key] = Session(key, worker, time.time() + duration * 60)
+            ingest.open(key)
+            worker.inbox.put(('start', key, None, None))
+        return True
+
+    def stop(self, user_id, exam_id):
+        key = (user_id, exam_id)
+        with self._lock:
+            session = self.sessions.pop(key, None)
+            if session is None:
+                return
+            self._release(session)
+
+    def _release(self, session):
+        if not session.expired:
+            session.expired = True
+            session.worker.sessions -= 1
+            session.worker.inbox.put(('stop', session.key, None, None))
+            ingest.close(session.key)
+
+    def is_running(self, user_id, exam_id):
+        session = self.sessions.get((user_id, exam_id))
+        return session is not None and not session.expired
+
+    def stats(self):
+        return {
+            'sessions': sum(w.sessions for w in self._pool or []),
+            'max_sessions': self.max_sessions,
+            'rejected': self.rejected,
+            'backpressured': self.backpressured,
+            'respawned': self.respawned,
+            'workers': [w.sessions for w in self._pool or []],
+        }
+
+    def _dispatch(self):
+        while True:
+            ingest.activity.wait(0.5)
+            ingest.activity.clear()
+            now = time.time()
+            with self._lock:
+                sessions = list(self.sessions.values())
+                for session in sessions:
+                    if not session.expired and session.deadline <= now:
+                        self._release(session)
+                    # keep expired sessions around for late submissions, for a while
+                    elif session.expired and session.deadline + 3600 <= now:
+                        del self.sessions[session.key]
+                for worker in self._pool:
+                    if not worker.process.is_alive() and worker.started + self.respawn_delay <= now:
+                        self._respawn(worker)
+                alive = {id(worker) for worker in self._pool if worker.process.is_alive()}
+            backlog = False
+            for session in sessions:
+                # frames of a dead worker's sessions wait in their buffers until it is back
+                if session.expired or id(session.worker) not in alive:
+                    continue
+                buffer = ingest.get(session.key)
+                if buffer is None or not len(buffer):
+                    continue
+                if not session.worker.slots.acquire(False):
+                    self.backpressured += 1
+                    backlog = True
+                    continue
+                frame = buffer.latest()
+                if frame is None:
+                    session.worker.slots.release()
+                    continue
+                session.worker.inbox.put(('frame', session.key, frame, time.time()))
+            if backlog:
+                # give busy workers a moment before offering them frames again
+                time.sleep(0.005)
+                ingest.activity.set()
+
+    def _collect(self):
+        while True:
+            try:
+                kind, key, payload, ts = self.results.get()
+                if kind == 'metrics':
+                    metrics.merge(key, payload)
+                else:
+                    hub.publish(kind, key, payload, ts)
+            except Exception:
+                traceback.print_exc()
+
+
+class Worker(object):
+    __slots__ = ('process', 'inbox', 'slots', 'sessions', 'started')
+
+    def __init__(self):
+        self.process = None
+        self.inbox = None
+        self.slots = None
+        self.sessions = 0
+        self.started = 0
+
+
+def _worker(inbox, slots, results, max_batch, max_wait):
+    from system.detection import Proctor
+    from system.registry import models, WORKER_MODELS
+    from system.events import bus
+    from system.dashboard import encode_thumbnail
+    from system.sinks import DisplaySink, AudioSink
+
+    models.warm_up(WORKER_MODELS)
+    detector = models.ssd_batch
+    threshold = min(app.config['DETECTION_THRESHOLDS'].values())
+    batcher = MicroBatcher(max_batch, max_wait)
+    proctors = {}
+    reported = time.time()
+    name = multiprocessing.current_process().name
+    metrics_every = app.config['METRICS_REPORT_INTERVAL']
+    metrics_at = 0
+    status_every = app.config['DASHBOARD_STATUS_INTERVAL']
+    thumbnail_every = app.config['DASHBOARD_THUMBNAIL_INTERVAL']
+    thumbnail_width = app.config['DASHBOARD_THUMBNAIL_WIDTH']
+    # when the status and the thumbnail of each session were last reported
+    reports = {}
+    sinks = app.config['PROCTOR_SINKS']
+    displays, beepers = {}, {}
+
+    def forward(alert):
+        results.put(('alert', (alert.user_id, alert.exam_id),
+                     {'kind': alert.kind,
+                      'confidence': None if alert.confidence is None else round(float(alert.confidence), 2),
+                      'time': alert.timestamp.strftime('%H:%M:%S')}, time.time()))
+
+    bus.subscribe(forward)
+
+    def report(key, proctor, frame):
+        now = time.time()
+        status_at, thumbnail_at = reports.get(key, (0, 0))
+        if now - status_at >= status_every:
+            status_at = now
+            results.put(('status', key, proctor.status(), now))
+        if now - thumbnail_at >= thumbnail_every:
+            thumbnail_at = now
+            results.put(('thumbnail', key, encode_thumbnail(frame, thumbnail_width), now))
+        reports[key] = (status_at, thumbnail_at)
+
+    def accept(message):
+        kind, key, frame, sent = message
+        if kind == 'frame':
+            if key in proctors:
+                return True
+            slots.release()
+        elif kind == 'start':
+            if key not in proctors:
+                try:
+                    proctors[key] = Proctor(*key, annotate='annotate' in sinks)
+                except Exception:
+                    traceback.print_exc()
+                    return False
+                if 'display' in sinks:
+                    displays[key] = DisplaySink(f'Proctor {key[0]}/{key[1]}')
+                if 'audio' in sinks:
+                    beepers[key] = bus.subscribe(AudioSink(), key)
+        elif kind == 'stop':
+            proctor = proctors.pop(key, None)
+            if proctor is not None:
+                proctor.close()
+                reports.pop(key, None)
+                results.put(('closed', key, None, time.time()))
+            if key in displays:
+                displays.pop(key).close()
+            if key in beepers:
+                beeper = beepers.pop(key)
+                bus.unsubscribe(beeper)
+                beeper.close()
+        return False
+
+    while True:
+        received = batcher.collect(inbox.get, accept)
+        # a session may have been stopped while its frame waited in the batch
+        batch = [message for message in received if message[1] in proctors]
+        try:
+            plans = [proctors[key].plan(frame) for _, key, frame, _ in batch]
+            # only frames due for object detection go through the SSD
+            due = [idx for idx, stages in enumerate(plans) if 'objects' in stages]
+            detected = {}
+            if due:
+                start = time.perf_counter()
+                detected = dict(zip(due, detector.detect([batch[idx][2] for idx in due], threshold)))
+                elapsed = time.perf_counter() - start
+                batcher.stats.record([time.time() - batch[idx][3] for idx in due], elapsed)
+                metrics.observe('proctor_batch_seconds', elapsed)
+                metrics.inc('proctor_batches_total')
+                metrics.inc('proctor_batched_frames_total', len(due))
+            for idx, (_, key, frame, sent) in enumerate(batch):
+                try:
+                    frame = proctors[key].process(frame, detected.get(idx), plans[idx])
+                    if key in displays:
+                        start = time.perf_counter()
+                        displays[key].show(frame)
+                        metrics.observe('proctor_stage_seconds', time.perf_counter() - start, stage='display')
+                    report(key, proctors[key], frame)
+                    metrics.observe('proctor_frame_latency_seconds', time.time() - sent)
+                except Exception:
+                    traceback.print_exc()
+        except Exception:
+            traceback.print_exc()
+        finally:
+            for _ in received:
+                slots.release()
+        if time.time() - metrics_at >= metrics_every:
+            metrics_at = time.time()
+            results.put(('metrics', name, metrics.snapshot(), metrics_at))
+        if time.time() - reported > 60:
+            reported = time.time()
+            print(f'Proctor worker {multiprocessing.current_process().name}: {batcher.stats.summary()}')
+
+
+@metrics.collector
+def _collect_scheduler(metrics):
+    if scheduler._pool is None:
+        return
+    stats = scheduler.stats()
+    metrics.set('proctor_sessions', stats['sessions'])
+    metrics.set('proctor_max_sessions', stats['max_sessions'])
+    metrics.total('proctor_sessions_rejected_total', stats['rejected'])
+    metrics.total('proctor_backpressured_total', stats['backpressured'])
+    metrics.total('proctor_workers_respawned_total', stats['respawned'])
+    for worker in scheduler._pool:
+        metrics.set('proctor_worker_sessions', worker.sessions, worker=worker.process.name)
+        try:
+            metrics.set('proctor_worker_inbox_depth', worker.inbox.qsize(), worker=worker.process.name)
+        except NotImplementedError:
+            pass
+
+
+scheduler = ProctorScheduler(app.config['PROCTOR_WORKERS'],
+                             app.config['PROCTOR_SESSIONS_PER_WORKER'],
+                             app.config['PROCTOR_FRAMES_IN_FLIGHT'],
+                             app.config['PROCTOR_MAX_BATCH'],
+                             app.config['PROCTOR_MAX_WAIT'])
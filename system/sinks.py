@@ -0,0 +1,57 @@
+import queue, threading
+import cv2
+
+try:
+    import winsound
+except ImportError:
+    winsound = None
+
+
+class DisplaySink(object):
+    """Shows the frames of a session in a window, for local debugging."""
+
+    def __init__(self, window='Live'):
+        self.window = window
+
+    def show(self, frame):
+        """Returns False once Esc has been pressed in the window."""
+        cv2.imshow(self.window, frame)
+        return cv2.waitKey(1) != 27
+
+    def close(self):
+        cv2.destroyWindow(self.window)
+
+
+class AudioSink(object):
+    """
+    Beeps on the alerts it is subscribed to. The beep plays on its own
+    thread; alerts arriving while it plays are not queued up. close()
+    stops the thread once the session is unsubscribed.
+    """
+
+    def __init__(self, frequency=2500, duration=100):
+        self.frequency = frequency
+        self.duration = duration
+        self._pending = queue.Queue(1)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __call__(self, alert):
+        try:
+            self._pending.put_nowait(alert)
+        except queue.Full:
+            pass
+
+    def close(self):
+        # waits for a beep already playing
+        self._pending.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            if self._pending.get() is None:
+                return
+            if winsound is not None:
+                winsound.Beep(self.frequency, self.duration)
+            else:
+                print('\a', end='', flush=True)
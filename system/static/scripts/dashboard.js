@@ -0,0 +1,48 @@
+// Live proctor dashboard. Session updates arrive as server-sent events,
+// each a JSON list of the sessions that changed; a session's thumbnail is
+// only fetched again when its version moves on.
+function start_dashboard(events_url, thumbnail_url){
+    var container = document.getElementById("sessions");
+    var empty = document.getElementById("empty");
+    var cards = {};
+
+    function card(user_id){
+        if(cards[user_id]){
+            return cards[user_id];
+        }
+        var element = document.createElement("div");
+        element.className = "col-sm-3 mb-3";
+        element.innerHTML = '<div class="card"><img class="card-img-top" alt="">' +
+            '<div class="card-body p-2"><h6 class="card-title"></h6>' +
+            '<p class="card-text small status"></p><ul class="small pl-3 mb-0 alerts"></ul></div></div>';
+        container.appendChild(element);
+        empty.style.display = "none";
+        cards[user_id] = {element: element, thumbnail: 0};
+        return cards[user_id];
+    }
+
+    function update(session){
+        var entry = card(session.user_id);
+        var element = entry.element;
+        var status = session.status;
+        element.querySelector(".card-title").textContent = "User " + session.user_id + (session.closed ? " (ended)" : "");
+        element.querySelector(".status").textContent = status.faces === undefined ? "Waiting for frames" :
+            status.faces + " face(s), gaze " + (status.gaze || "unknown") + ", " + status.violations + " violation(s)" +
+            (status.identity && status.identity != "verified" ? ", " + status.identity : "") +
+            (status.objects && status.objects.length ? ", " + status.objects.join(", ") : "");
+        var card_class = "card" + (status.violations || (status.identity && status.identity != "verified") ? " border-danger" : "");
+        element.firstChild.className = card_class;
+        element.querySelector(".alerts").innerHTML = session.alerts.map(function(alert){
+            return "<li>" + alert.time + " " + alert.kind + "</li>";
+        }).join("");
+        if(session.thumbnail && session.thumbnail != entry.thumbnail){
+            entry.thumbnail = session.thumbnail;
+            element.querySelector("img").src = thumbnail_url.replace(/0$/, session.user_id) + "?v=" + session.thumbnail;
+        }
+    }
+
+    var source = new EventSource(events_url);
+    source.onmessage = function(event){
+        JSON.parse(event.data).forEach(update);
+    };
+}
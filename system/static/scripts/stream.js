@@ -0,0 +1,70 @@
+// Streams webcam frames to the server for proctoring. Frames are encoded
+// as WebP (JPEG where unsupported) and posted in small batches, each frame
+// prefixed by its length as a 4 byte big-endian integer.
+function start_frame_stream(url, fps, batch, width, height){
+    var video = document.createElement("video");
+    var canvas = document.createElement("canvas");
+    canvas.width = width;
+    canvas.height = height;
+    var ctx = canvas.getContext("2d");
+    var pending = [];
+    var sending = false;
+
+    function encode(callback){
+        canvas.toBlob(function(blob){
+            if(blob && blob.type == "image/webp"){
+                callback(blob);
+            }
+            else{
+                canvas.toBlob(callback, "image/jpeg", 0.7);
+            }
+        }, "image/webp", 0.7);
+    }
+
+    function flush(){
+        if(sending || pending.length < batch){
+            return;
+        }
+        var parts = [];
+        pending.splice(0, pending.length).forEach(function(blob){
+            var header = new DataView(new ArrayBuffer(4));
+            header.setUint32(0, blob.size);
+            parts.push(header.buffer, blob);
+        });
+        sending = true;
+        fetch(url, {
+            method: "POST",
+            credentials: "same-origin",
+            headers: {"Content-Type": "application/octet-stream"},
+            body: new Blob(parts)
+        }).catch(function(err){
+            console.log("Frame upload failed: " + err);
+        }).finally(function(){
+            sending = false;
+        });
+    }
+
+    function capture(){
+        ctx.drawImage(video, 0, 0, width, height);
+        encode(function(blob){
+            if(blob){
+                pending.push(blob);
+                // while an upload is in flight keep only the newest frames
+                if(pending.length > batch * 2){
+                    pending.shift();
+                }
+                flush();
+            }
+        });
+    }
+
+    navigator.mediaDevices.getUserMedia({video: true})
+    .then(function(mediaStream){
+        video.srcObject = mediaStream;
+        video.play();
+        setInterval(capture, 1000 / fps);
+    })
+    .catch(function(err){
+        console.log("Unable to access camera: " + err);
+    });
+}
@@ -0,0 +1,106 @@
+import itertools
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """Intersection over union of every (left, top, right, bottom) box of
+    `a` with every box of `b`, (len(a), len(b))."""
+    a = np.asarray(a, np.float32).reshape(-1, 4)
+    b = np.asarray(b, np.float32).reshape(-1, 4)
+    left = np.maximum(a[:, None, 0], b[None, :, 0])
+    top = np.maximum(a[:, None, 1], b[None, :, 1])
+    right = np.minimum(a[:, None, 2], b[None, :, 2])
+    bottom = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+class Track(object):
+    __slots__ = ('id', 'label', 'box', 'velocity', 'confidence', 'hits', 'missed', '_anchor', '_seen')
+
+    def __init__(self, id, label, box, confidence, frame):
+        self.id = id
+        self.label = label
+        self.box = box
+        self.velocity = np.zeros(4, np.float32)
+        self.confidence = confidence
+        self.hits = 1
+        self.missed = 0
+        self._anchor = box
+        self._seen = frame
+
+    def xywh(self):
+        left, top, right, bottom = (int(round(v)) for v in self.box)
+        return left, top, right - left, bottom - top
+
+
+class IoUTracker(object):
+    """
+    Gives detections stable IDs across frames. Detections are matched to
+    the existing tracks of the same label greedily by box overlap; those
+    left over start new tracks. Between detector runs, predict() moves
+    every track by its last observed velocity, so boxes follow the object
+    when the detector only runs every few frames. A track that misses
+    `max_missed` consecutive detector runs is dropped.
+    """
+
+    def __init__(self, min_iou=0.3, max_missed=2):
+        self.min_iou = min_iou
+        self.max_missed = max_missed
+        self.tracks = []
+        self.frame = 0
+        self._ids = itertools.count(1)
+
+    def predict(self):
+        """Advances the tracks to the next frame without detections."""
+        self.frame += 1
+        for track in self.tracks:
+            track.box = track.box + track.velocity
+        return self.tracks
+
+    def update(self, boxes, labels=None, confidences=None):
+        """Advances the tracks to the next frame with its detections, as
+        (left, top, right, bottom) boxes. Returns the tracks started by
+        this frame."""
+        self.predict()
+        boxes = np.asarray(boxes, np.float32).reshape(-1, 4)
+        labels = np.zeros(len(boxes), np.int32) if labels is None else np.asarray(labels).reshape(-1)
+        confidences = np.ones(len(boxes), np.float32) if confidences is None \
+            else np.asarray(confidences, np.float32).reshape(-1)
+
+        overlaps = iou_matrix([track.box for track in self.tracks], boxes)
+        if overlaps.size:
+            track_labels = np.array([track.label for track in self.tracks])
+            overlaps[track_labels[:, None] != labels[None, :]] = 0
+        matched_tracks, matched_boxes = set(), set()
+        # greedy assignment, best overlap first
+        for flat in np.argsort(overlaps, axis=None)[::-1]:
+            t, d = np.unravel_index(flat, overlaps.shape)
+            if overlaps[t, d] < self.min_iou:
+                break
+            if t in matched_tracks or d in matched_boxes:
+                continue
+            matched_tracks.add(t)
+            matched_boxes.add(d)
+            track = self.tracks[t]
+            track.velocity = (boxes[d] - track._anchor) / (self.frame - track._seen)
+            track.box = track._anchor = boxes[d]
+            track._seen = self.frame
+            track.confidence = float(confidences[d])
+            track.hits += 1
+            track.missed = 0
+
+        kept = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    continue
+            kept.append(track)
+        started = [Track(next(self._ids), labels[d].item(), boxes[d], float(confidences[d]), self.frame)
+                   for d in range(len(boxes)) if d not in matched_boxes]
+        self.tracks = kept + started
+        return started
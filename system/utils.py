@@ -1,4 +1,4 @@
-import secrets, os, csv, cv2, face_recognition, base64
+import secrets, os, cv2, face_recognition, base64
 from io import BytesIO
 import numpy as np
 from PIL import Image
@@ -6,6 +6,10 @@ from flask import url_for
 from flask_mail import Message
 from flask_login import current_user
 from system import mail, app
+from system.registry import models
+from system.encodings import encodings, match_faces
+from system.identity import identity
+from system.events import events
 
 
 ALLOWED_EXTENSIONS = {'csv', 'txt'}
@@ -43,46 +47,8 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def get_questions(filename):
-    filename = os.path.join(app.root_path, 'static/questions', filename)
-    with open(filename, newline='') as f:
-        reader = csv.reader(f)
-        data = list(reader)
-    for idx, row in enumerate(data):
-        data[idx].append(idx)
-    return data[1:]
-
-
-def get_result(responses, test, marks):
-    count = 0
-    per_question = marks/len(responses)
-    for i in range(len(responses)):
-        if responses[i]:
-            if responses[i] == test[i][-2]:
-                count += per_question
-    return count
-
-
-def store_responses(filename, responses):
-    path = os.path.join(app.root_path, 'static', 'responses', filename+'.csv')
-    with open(path, 'w') as csvfile: 
-        csvwriter = csv.writer(csvfile) 
-        csvwriter.writerows(responses) 
-
-    return path
-
-
-def parse_answers(path):
-    path = os.path.join(app.root_path, 'static', 'responses', str(path))
-    with open(path, newline='\n') as f:
-        reader = csv.reader(f)
-        data = list(reader)
-    return data
-
-
 def image_to_encoding(image, username):
     file_path = username + '.npy'
-    encoding_path = os.path.join(app.root_path, 'static/encodings', file_path)
 
     sbuf = BytesIO()
     sbuf.write(base64.b64decode(image[22:]))
@@ -92,14 +58,15 @@ def image_to_encoding(image, username):
     img_enc = face_recognition.face_encodings(img)[0]
     if img_enc.size == 0:
         return False
-    np.save(encoding_path, img_enc)
+    encodings.add(file_path, img_enc)
 
     return file_path
 
 
-def verify_face(encodings, image):
-    encoding_path = os.path.join(app.root_path, 'static/encodings', current_user.encoding_file)
-    face_encodings_for_id = np.load(encoding_path, allow_pickle=True)
+def verify_face(encoding_file, image, exam_id=None):
+    face_encodings_for_id = encodings.get(encoding_file) if encoding_file else None
+    if face_encodings_for_id is None:
+        return False
 
     sbuf = BytesIO()
     sbuf.write(base64.b64decode(image[22:]))
@@ -110,26 +77,32 @@ def verify_face(encodings, image):
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
-    face_detector = cv2.CascadeClassifier(os.path.join(app.root_path, 'static/models', 'haarcascade_frontalface_alt2.xml'))
-     
-    faces = face_detector.detectMultiScale(
-        gray,
-        scaleFactor=1.2,
-        minNeighbors=5,
-        minSize=(50, 50),
-        flags=cv2.CASCADE_SCALE_IMAGE
-    )
-
-    result = [None]*len(faces)
-
-    for idx, (x,y,w,h) in enumerate(faces):
-        encoding = face_recognition.face_encodings(rgb, [(y, x+w, y+h, x)])[0]
-        if encoding.size == 0:
-            print("No face detected...")
+    with models.lock('haar_face'):
+        faces = models.haar_face.detectMultiScale(
+            gray,
+            scaleFactor=1.2,
+            minNeighbors=5,
+            minSize=(50, 50),
+            flags=cv2.CASCADE_SCALE_IMAGE
+        )
+
+    face_encodings = face_recognition.face_encodings(rgb, [(y, x+w, y+h, x) for (x,y,w,h) in faces])
+    if not face_encodings:
+        print("No face detected...")
+        return False
+
+    tolerance = app.config['FACE_MATCH_TOLERANCE']
+    result = match_faces(np.array(face_encodings), face_encodings_for_id, tolerance)
+
+    # a face that is not the claimed student but another enrolled one
+    for idx, username, distance in identity.impostors(face_encodings, encodings.key(encoding_file), tolerance):
+        if not result[idx]:
+            print(f'{current_user.username} presented the face of {username} ({distance:.2f})')
+            if exam_id is not None:
+                events.record(exam_id, current_user.id, 'impersonation', 1 - distance)
             return False
-        result[idx] = face_recognition.compare_faces([face_encodings_for_id], encoding, 0.3)[0]
 
-    if any(result):
+    if result.any():
         return True
     return False
 